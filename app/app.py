@@ -1,138 +1,486 @@
-from flask import Flask, jsonify, abort, make_response, request, url_for, g
+from flask import Flask, Blueprint, Response, jsonify, abort, make_response, request, url_for, g, \
+    current_app, stream_with_context
+from werkzeug.local import LocalProxy
+from functools import partial
+from itertools import islice
+from json import loads
+from hmac import compare_digest
+from time import perf_counter
+from zlib import crc32
 from db.queries import Queries
+from db.pool import PoolTimeoutError
+from serialization import EmployeeSerializer, EmployeesPageWriter, make_json_provider
+from metrics import Metrics, content_type as metrics_content_type
+from profiling import RequestProfiler
+import atexit
+import weakref
+import os
 import staff
 
-app = Flask(__name__)
-app.config.from_object(__name__)
+api = Blueprint('api', __name__)
+queries = LocalProxy(lambda: current_app.extensions['queries'])
+
+# applications created in this process, they are reset in forked workers
+created_apps = weakref.WeakSet()
+
+
+def close_connections_before_fork():
+    # SQLite connections must not cross fork, also the idle one left by init_db in preloading parent
+    for app in list(created_apps):
+        app.extensions['queries'].close_connections()
+
+
+def reset_after_fork():
+    # connections, locks and caches inherited from preloading parent are not used by forked workers
+    for app in list(created_apps):
+        app.extensions['queries'].reset_after_fork()
+        app.extensions['metrics'].reset()
+        if 'profiler' in app.extensions:
+            app.extensions['profiler'].reset()
+
+
+# registered once per process, not for every created application
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=close_connections_before_fork, after_in_child=reset_after_fork)
+
+
+def create_app(config=None):
+    app = Flask(__name__)
+    app.config.from_object(__name__)
+    if config is not None:
+        app.config.update(config)
+
+    with app.app_context():
+        app.extensions['queries'] = Queries(app)
+    app.extensions['metrics'] = Metrics()
+    app.json = make_json_provider(app, app.config['JSON_ENCODER'])
+
+    created_apps.add(app)
+
+    if app.config['METRICS_ENABLED']:
+        app.before_request(start_request_metrics)
+        app.after_request(save_response_status)
+        app.teardown_request(finish_request_metrics)
+
+    if app.config['REQUEST_PROFILER'] not in ['off', 'on', 'all']:
+        raise ValueError('Unknown request profiler mode \'' + str(app.config['REQUEST_PROFILER']) + '\'')
+
+    if app.config['REQUEST_PROFILER'] != 'off':
+        app.extensions['profiler'] = RequestProfiler(
+            app.config['PROFILE_DIR'],
+            app.config['PROFILE_DIR_MAX_FILES'],
+            app.config['PROFILE_SAMPLE_PERCENT'],
+            app.config['PROFILE_SLOW_THRESHOLD'],
+            app.config['PROFILE_FORMAT']
+        )
+
+        app.before_request(start_request_profile)
+        app.after_request(finish_request_profile)
+        app.teardown_request(stop_request_profile)
+
+    if app.config['SQL_PROFILE_DUMP'] is not None:
+        atexit.register(dump_sql_profile, app)
+
+    app.teardown_appcontext(close_db)
+    app.register_blueprint(api)
+    return app
 
-with app.app_context():
-    queries = Queries(app)
 
-@app.teardown_appcontext
 def close_db(error):
     queries.close_db()
 
 
-def make_public_employee(employee):
-    new_employee = {}
-    for col in employee:
-        if col == 'id':
-            new_employee['uri'] = url_for('get_employee', employee_id=employee['id'], _external=True)
+def dump_sql_profile(app):
+    # every worker process writes its own file, when the path has {pid}
+    profiler = app.extensions['queries'].profiler
+    if profiler is not None:
+        profiler.dump(app.config['SQL_PROFILE_DUMP'].format(pid=os.getpid()))
+
+
+def is_admin(authorization, config):
+    return authorization is not None and \
+        authorization.type == 'basic' and \
+        compare_digest(str(authorization.username), config['USERNAME']) and \
+        compare_digest(str(authorization.password), config['PASSWORD'])
+
+
+def start_request_profile():
+    # profiled on admin demand (X-Profile header) or when sampled, kept if sampled one is slow
+    is_requested = current_app.config['REQUEST_PROFILER'] == 'all' or \
+        ('X-Profile' in request.headers and is_admin(request.authorization, current_app.config))
+
+    profiler = current_app.extensions['profiler']
+    if is_requested or profiler.is_sampled():
+        g.request_profile = (profiler.start(), is_requested, perf_counter())
+
+
+def finish_request_profile(response):
+    if g.get('request_profile') is None:
+        return response
+
+    profile, is_requested, started = g.pop('request_profile')
+    if profile is None:
+        if is_requested:
+            response.headers['X-Profile'] = 'busy'
+        return response
+
+    seconds = perf_counter() - started
+    profiler = current_app.extensions['profiler']
+    profiler.stop(profile)
+
+    if is_requested or seconds >= profiler.slow_threshold:
+        response.headers['X-Profile'] = profiler.save(profile, request.endpoint or 'none', seconds)
+    return response
+
+
+def stop_request_profile(error):
+    # after_request is skipped when response is not made
+    if g.get('request_profile') is not None:
+        profile, is_requested, started = g.pop('request_profile')
+        if profile is not None:
+            current_app.extensions['profiler'].stop(profile)
+
+
+def start_request_metrics():
+    g.request_stats = current_app.extensions['metrics'].start_request()
+    g.request_stats.endpoint = request.endpoint
+
+
+def save_response_status(response):
+    g.request_stats.status = response.status_code
+    return response
+
+
+def finish_request_metrics(error):
+    stats = g.get('request_stats')
+    if stats is not None and not stats.is_streamed:
+        current_app.extensions['metrics'].finish_request(stats, request.method)
+
+
+def count_returned_rows(number):
+    if 'request_stats' in g:
+        g.request_stats.rows_returned += number
+
+
+@api.app_errorhandler(PoolTimeoutError)
+def database_unavailable(error):
+    return make_response(jsonify({'error': 'Database unavailable'}), 503)
+
+
+def get_serializer():
+    if 'serializer' not in g:
+        g.serializer = EmployeeSerializer(url_for('api.get_employee', employee_id=0, _external=True))
+    return g.serializer
+
+
+def make_employees_page(employees, limit, serializer=None):
+    if serializer is None:
+        serializer = get_serializer()
+
+    page = {
+        'employees': serializer.make_public_employees(employees[:limit])
+    }
+
+    if limit is not None:
+        if len(employees) > limit:
+            page['next'] = staff.encode_cursor(employees[limit - 1]['id'])
         else:
-            new_employee[col] = employee[col]
-    return new_employee
+            page['next'] = None
 
+    return page
 
-# --- ROUTES --- #
-@app.route(staff.Routes.api_employees, methods=['GET'])
-def get_employees():
-    return jsonify(
-        {
-            'employees': list(map(make_public_employee, queries.select_all()))
-        }
-    )
 
+def make_search_page(employees, limit, serializer=None):
+    page = make_employees_page(employees, limit, serializer)
 
-@app.route(staff.Routes.api_employee, methods=['GET'])
-def get_employee(employee_id):
-    is_exist, employee = queries.select_employee_by_id(employee_id)
+    # search results are ordered by rank, so cursor holds rank of the last employee too
+    if page['next'] is not None:
+        page['next'] = staff.encode_search_cursor(employees[limit - 1]['match_rank'], employees[limit - 1]['id'])
+    return page
 
-    if is_exist:
-        code = 200
-    else:
-        code = 404
 
-    return jsonify(
-        {
-            'employee': list(map(make_public_employee, employee))
-        }
-    ), code
+def stream_employees_page(employees, limit):
+    writer = EmployeesPageWriter(get_serializer(), current_app.json, limit)
+    fetch_size = queries.fetch_size
 
+    def generate():
+        yield writer.start()
 
-@app.route(staff.Routes.api_employees, methods=['POST'])
-def create_employee():
-    if not request.json or \
-            len([x for x in request.json if x in queries.employee_keys]) != \
-            len(queries.employee_keys) or \
-            not staff.is_date(request.json['birthdate']) or \
-            not staff.is_date(request.json['enrollmentdate']) or \
-            len(request.json['name']) > 120 or \
-            len(request.json['position']) > 120:
+        while not writer.is_truncated:
+            batch = list(islice(employees, fetch_size))
+            if len(batch) == 0:
+                break
+            yield writer.write(batch)
+
+        yield writer.finish()
+        count_returned_rows(writer.count)
+
+    response = Response(stream_with_context(generate()), mimetype='application/json')
+
+    if 'request_stats' in g:
+        # finished when the server closes the response, after the last chunk
+        g.request_stats.is_streamed = True
+        response.call_on_close(
+            partial(current_app.extensions['metrics'].finish_request, g.request_stats, request.method)
+        )
+    return response
+
+
+def make_etag(revision, url):
+    # URIs in responses are external, so the full request URL is a part of the representation
+    return '%d-%08x' % (revision, crc32(url.encode('utf-8')))
+
+
+def respond_not_modified(etag):
+    response = make_response('', 304)
+    response.set_etag(etag)
+    return response
+
+
+def respond_employees_page(filters, limit, after_id, etag=None):
+    fetch_limit = limit + 1 if limit else None
+    is_stream = staff.is_stream_requested(request.args)
+
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        return respond_not_modified(etag)
+
+    if is_stream:
+        response = stream_employees_page(
+            queries.iterate_with_filtration(filters, limit=fetch_limit, after_id=after_id),
+            limit
+        )
+    else:
+        page = make_employees_page(
+            queries.select_with_filtration(filters, limit=fetch_limit, after_id=after_id),
+            limit
+        )
+        count_returned_rows(len(page['employees']))
+        response = jsonify(page)
+
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+def respond_search_page(search_query, filters, limit, after):
+    page = make_search_page(
+        queries.search_employees(search_query, filters, limit=limit + 1, after=after),
+        limit
+    )
+    count_returned_rows(len(page['employees']))
+    return jsonify(page)
+
+
+# --- REQUEST HANDLING, shared with ASGI variant --- #
+def check_filters(filters):
+    if not filters or \
+            type(filters) != list:
         abort(400)
 
-    is_created, employee = queries.insert_employee(request.json)
+    return staff.check_filtration(filters)
+
 
-    if is_created:
-        code = 201
+def load_bulk_employees(mimetype, data, get_json):
+    if mimetype == 'application/x-ndjson':
+        employees = []
+        for line in data.decode('utf-8', 'replace').splitlines():
+            if line.strip():
+                try:
+                    employees.append(loads(line))
+                except ValueError:
+                    employees.append(None)
     else:
-        code = 409
+        employees = get_json(silent=True)
 
-    return jsonify(
-        {
-            'employee': list(map(make_public_employee, employee))
-        }
-    ), code
+    if not employees or \
+            type(employees) != list:
+        abort(400)
 
+    if len(employees) > staff.max_bulk_employees:
+        abort(413)
 
-@app.route(staff.Routes.api_employees_filter, methods=['POST'])
-def get_employees_with_filter():
-    if not request.json or \
-            type(request.json) != list:
+    return employees
+
+
+def make_employee_result(employee, serializer):
+    return {
+        'employee': [serializer.make_public_employee(e) for e in employee]
+    }
+
+
+def find_employee(employee_id, url):
+    is_exist, employee, revision = queries.select_employee_with_revision(employee_id)
+    return employee, make_etag(revision, url) if is_exist else None
+
+
+def create_employee_result(employee, serializer):
+    if not employee or \
+            not staff.is_correct_employee(employee, queries.employee_keys):
         abort(400)
 
-    filters = staff.check_filtration(request.json)
+    is_created, employee = queries.insert_employee(employee)
+
+    return make_employee_result(employee, serializer), 201 if is_created else 409
+
+
+def create_employees_result(employees, serializer):
+    valid_employees = [e for e in employees if staff.is_correct_employee(e, queries.employee_keys)]
+    ids = iter(queries.insert_employees(valid_employees))
+
+    results = []
+    for employee in employees:
+        if not staff.is_correct_employee(employee, queries.employee_keys):
+            results.append({'status': 'invalid'})
+            continue
+
+        employee_id = next(ids)
+        if employee_id is None:
+            results.append({'status': 'duplicate'})
+        else:
+            result = serializer.make_public_employee({'id': employee_id})
+            result['status'] = 'created'
+            results.append(result)
+
+    return {
+        'employees': results
+    }
+
+
+def delete_employee_result(employee_id, serializer):
+    is_exist, employee = queries.delete_employee_by_id(employee_id)
+    count_returned_rows(len(employee))
+
+    return make_employee_result(employee, serializer), 200 if is_exist else 404
+
+
+def delete_employees_result(filters, serializer):
+    is_deleted, deleted_employees = queries.delete_employees(filters)
+    count_returned_rows(len(deleted_employees))
+
+    return {
+        'employees': serializer.make_public_employees(deleted_employees)
+    }, 200 if is_deleted else 404
+
+
+# --- ROUTES --- #
+@api.route(staff.Routes.api_employees, methods=['GET'])
+def get_employees():
+    limit, after_id = staff.check_pagination(request.args)
+
+    # revision is read before employees, a concurrent write only makes the ETag stale
+    revision = queries.select_revision()
+
+    return respond_employees_page([], limit, after_id, etag=make_etag(revision, request.url))
+
 
-    return jsonify(
-        {
-            'employees': list(map(make_public_employee, queries.select_with_filtration(filters)))
-        }
+@api.route(staff.Routes.api_employee, methods=['GET'])
+def get_employee(employee_id):
+    employee, etag = find_employee(employee_id, request.url)
+
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        return respond_not_modified(etag)
+
+    count_returned_rows(len(employee))
+
+    response = make_response(
+        jsonify(make_employee_result(employee, get_serializer())),
+        200 if etag is not None else 404
     )
 
-@app.route(staff.Routes.api_employees, methods=['DELETE'])
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+@api.route(staff.Routes.api_employees, methods=['POST'])
+def create_employee():
+    result, code = create_employee_result(request.json, get_serializer())
+    return jsonify(result), code
+
+
+@api.route(staff.Routes.api_employees_bulk, methods=['POST'])
+def create_employees():
+    employees = load_bulk_employees(request.mimetype, request.get_data(), request.get_json)
+    return jsonify(create_employees_result(employees, get_serializer()))
+
+
+@api.route(staff.Routes.api_employees_filter, methods=['POST'])
+def get_employees_with_filter():
+    filters = check_filters(request.json)
+    limit, after_id = staff.check_pagination(request.args)
+
+    return respond_employees_page(filters, limit, after_id)
+
+
+@api.route(staff.Routes.api_employees_search, methods=['GET'])
+def search_employees():
+    search_query = staff.make_search_query(request.args.get('q'))
+    limit, after = staff.check_search_pagination(request.args)
+
+    return respond_search_page(search_query, [], limit, after)
+
+
+@api.route(staff.Routes.api_employees_search, methods=['POST'])
+def search_employees_with_filter():
+    filters = check_filters(request.json)
+    search_query = staff.make_search_query(request.args.get('q'))
+    limit, after = staff.check_search_pagination(request.args)
+
+    return respond_search_page(search_query, filters, limit, after)
+
+
+@api.route(staff.Routes.api_employees, methods=['DELETE'])
 def delete_employees():
     queries.delete_all()
     return jsonify({'result': True})
 
 
-@app.route(staff.Routes.api_employee, methods=['DELETE'])
+@api.route(staff.Routes.api_employee, methods=['DELETE'])
 def delete_employee(employee_id):
-    is_exist, employee = queries.delete_employee_by_id(employee_id)
+    result, code = delete_employee_result(employee_id, get_serializer())
+    return jsonify(result), code
 
-    if is_exist:
-        code = 200
-    else:
-        code = 404
 
-    return jsonify(
-        {
-            'employee': list(map(make_public_employee, employee))
-        }
-    ), code
+@api.route(staff.Routes.api_employees_filter, methods=['DELETE'])
+def delete_employees_with_filter():
+    filters = check_filters(request.json)
+
+    result, code = delete_employees_result(filters, get_serializer())
+    return jsonify(result), code
 
 
-@app.route(staff.Routes.api_employees_filter, methods=['DELETE'])
-def delete_employees_with_filter():
-    if not request.json or \
-            type(request.json) != list:
-        abort(400)
+@api.route(staff.Routes.api_metrics, methods=['GET'])
+def get_metrics():
+    if not current_app.config['METRICS_ENABLED']:
+        abort(404)
+
+    return Response(
+        current_app.extensions['metrics'].render(queries),
+        content_type=metrics_content_type
+    )
 
-    filters = staff.check_filtration(request.json)
 
-    is_deleted, deleted_employees = queries.delete_employees(filters)
+@api.route(staff.Routes.api_admin_sql_profile, methods=['GET', 'DELETE'])
+def sql_profile():
+    profiler = queries.profiler
+    if profiler is None:
+        abort(404)
 
-    if is_deleted:
-        code = 200
-    else:
-        code = 404
+    if not is_admin(request.authorization, current_app.config):
+        return make_response(
+            jsonify({'error': 'Unauthorized'}),
+            401,
+            {'WWW-Authenticate': 'Basic realm="admin"'}
+        )
+
+    if request.method == 'DELETE':
+        profiler.reset()
+        return jsonify({'result': True})
 
-    return jsonify(
-        {
-            'employees': list(map(make_public_employee, deleted_employees))
-        }
-    ), code
+    return jsonify(profiler.report())
 
 
 # -------------- #
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
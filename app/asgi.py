@@ -0,0 +1,424 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar, copy_context
+from functools import partial
+from json import loads
+from threading import Event
+from urllib.parse import parse_qsl, quote
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException, BadRequest, NotFound, UnsupportedMediaType, InternalServerError
+from werkzeug.datastructures import Authorization
+from werkzeug.http import parse_etags, parse_options_header, quote_etag
+from app import create_app, make_employees_page, make_search_page, make_etag, is_admin, check_filters, \
+    load_bulk_employees, make_employee_result, find_employee, create_employee_result, create_employees_result, \
+    delete_employee_result, delete_employees_result
+from serialization import EmployeeSerializer, EmployeesPageWriter, dumps_compact
+from metrics import content_type as metrics_content_type
+from flask import g
+from db.pool import PoolTimeoutError
+import asyncio
+import staff
+
+flask_app = create_app()
+queries = flask_app.extensions['queries']
+metrics = flask_app.extensions['metrics']
+
+# one thread per pooled connection, so database calls never wait for the pool inside the executor
+executor = ThreadPoolExecutor(
+    max_workers=flask_app.config['DATABASE_POOL_SIZE'],
+    thread_name_prefix='database'
+)
+stream_queue_size = 4
+# metrics of current request, visible in executor threads through copied context
+request_stats = ContextVar('request_stats', default=None)
+
+
+class Request(object):
+
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.root_path = scope.get('root_path', '')
+        self.scheme = scope.get('scheme', 'http')
+        self.query_string = scope['query_string'].decode('latin-1')
+        self.headers = dict(
+            (name.decode('latin-1').lower(), value.decode('latin-1')) for name, value in scope['headers']
+        )
+        self.body = body
+
+        if 'host' in self.headers:
+            self.host = self.headers['host']
+        elif scope.get('server') is not None:
+            self.host = '%s:%d' % tuple(scope['server'])
+        else:
+            self.host = 'localhost'
+
+        self.args = MultiDict(parse_qsl(self.query_string, keep_blank_values=True))
+        self.mimetype = parse_options_header(self.headers.get('content-type', ''))[0]
+        self.url = self.scheme + '://' + self.host + quote(self.root_path + self.path)
+        if self.query_string:
+            self.url += '?' + self.query_string
+
+    def is_json(self):
+        return self.mimetype == 'application/json' or \
+            (self.mimetype.startswith('application/') and self.mimetype.endswith('+json'))
+
+    def get_json(self, silent=False):
+        if not self.is_json():
+            if silent:
+                return None
+            raise UnsupportedMediaType()
+
+        try:
+            return loads(self.body)
+        except ValueError:
+            if silent:
+                return None
+            raise BadRequest()
+
+    def is_not_modified(self, etag):
+        return parse_etags(self.headers.get('if-none-match')).contains_weak(etag)
+
+
+class Response(object):
+
+    def __init__(self, body=b'', status=200, headers=None, mimetype='application/json'):
+        self.body = body
+        self.status = status
+        self.headers = list(headers or [])
+        if mimetype is not None:
+            self.headers.append(('Content-Type', mimetype))
+
+    def set_etag(self, etag):
+        self.headers.append(('ETag', quote_etag(etag)))
+
+    def encode_headers(self):
+        return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in self.headers]
+
+    async def send(self, send, is_head=False):
+        headers = self.encode_headers() + [(b'content-length', str(len(self.body)).encode('latin-1'))]
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b'' if is_head else self.body})
+
+
+class EmployeesStreamResponse(Response):
+
+    def __init__(self, serializer, iterate, limit):
+        Response.__init__(self)
+        self.serializer = serializer
+        self.iterate = iterate
+        self.limit = limit
+
+    def produce(self, loop, queue, stop):
+        def put(item):
+            asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        with flask_app.app_context():
+            g.request_stats = request_stats.get()
+            try:
+                employees = []
+                for employee in self.iterate():
+                    employees.append(employee)
+                    if len(employees) == queries.fetch_size:
+                        put(employees)
+                        employees = []
+                        if stop.is_set():
+                            return
+                put(employees)
+                put(None)
+            except Exception as err:
+                put(err)
+
+    async def send(self, send, is_head=False):
+        await send({'type': 'http.response.start', 'status': self.status, 'headers': self.encode_headers()})
+        if is_head:
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=stream_queue_size)
+        stop = Event()
+        loop.run_in_executor(executor, copy_context().run, self.produce, loop, queue, stop)
+
+        writer = EmployeesPageWriter(self.serializer, flask_app.json, self.limit)
+        try:
+            await self.send_chunk(send, writer.start())
+
+            while not writer.is_truncated:
+                employees = await queue.get()
+                if employees is None:
+                    break
+                if isinstance(employees, Exception):
+                    raise employees
+
+                await self.send_chunk(send, writer.write(employees))
+
+            await self.send_chunk(send, writer.finish(), more_body=False)
+            count_returned_rows(writer.count)
+        finally:
+            # a producer blocked on the full queue sees the stop flag after its last put
+            stop.set()
+            while not queue.empty():
+                queue.get_nowait()
+
+    async def send_chunk(self, send, chunk, more_body=True):
+        await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': more_body})
+
+
+def make_json_response(obj, status=200):
+    return Response(dumps_compact(flask_app.json, obj).encode('utf-8') + b'\n', status)
+
+
+def make_error_response(error):
+    response = error.get_response()
+    # content length is added by send
+    headers = [(name, value) for name, value in response.headers.items() if name.lower() != 'content-length']
+    return Response(response.get_data(), response.status_code, headers, mimetype=None)
+
+
+def make_serializer(adapter):
+    return EmployeeSerializer(adapter.build('api.get_employee', {'employee_id': 0}, force_external=True))
+
+
+def call_in_app_context(func, *args, **kwargs):
+    with flask_app.app_context():
+        g.request_stats = request_stats.get()
+        return func(*args, **kwargs)
+
+
+async def run_db(func, *args, **kwargs):
+    return await asyncio.get_running_loop().run_in_executor(
+        executor,
+        copy_context().run,
+        partial(call_in_app_context, func, *args, **kwargs)
+    )
+
+
+def count_returned_rows(number):
+    stats = request_stats.get()
+    if stats is not None:
+        stats.rows_returned += number
+
+
+async def respond_employees_page(request, serializer, filters, limit, after_id, etag=None):
+    fetch_limit = limit + 1 if limit else None
+    is_stream = staff.is_stream_requested(request.args)
+
+    if etag is not None and request.is_not_modified(etag):
+        return respond_not_modified(etag)
+
+    if is_stream:
+        response = EmployeesStreamResponse(
+            serializer,
+            partial(queries.iterate_with_filtration, filters, limit=fetch_limit, after_id=after_id),
+            limit
+        )
+    else:
+        employees = await run_db(queries.select_with_filtration, filters, limit=fetch_limit, after_id=after_id)
+        page = make_employees_page(employees, limit, serializer)
+        count_returned_rows(len(page['employees']))
+        response = make_json_response(page)
+
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+async def respond_search_page(serializer, search_query, filters, limit, after):
+    employees = await run_db(queries.search_employees, search_query, filters, limit=limit + 1, after=after)
+    page = make_search_page(employees, limit, serializer)
+    count_returned_rows(len(page['employees']))
+    return make_json_response(page)
+
+
+def respond_not_modified(etag):
+    response = Response(status=304, mimetype=None)
+    response.set_etag(etag)
+    return response
+
+
+# --- ROUTES --- #
+async def get_employees(request, serializer):
+    limit, after_id = staff.check_pagination(request.args)
+
+    # revision is read before employees, a concurrent write only makes the ETag stale
+    revision = await run_db(queries.select_revision)
+
+    return await respond_employees_page(request, serializer, [], limit, after_id, etag=make_etag(revision, request.url))
+
+
+async def get_employee(request, serializer, employee_id):
+    employee, etag = await run_db(find_employee, employee_id, request.url)
+
+    if etag is not None and request.is_not_modified(etag):
+        return respond_not_modified(etag)
+
+    count_returned_rows(len(employee))
+
+    response = make_json_response(make_employee_result(employee, serializer), 200 if etag is not None else 404)
+
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+
+async def create_employee(request, serializer):
+    result, code = await run_db(create_employee_result, request.get_json(), serializer)
+    return make_json_response(result, code)
+
+
+async def create_employees(request, serializer):
+    employees = load_bulk_employees(request.mimetype, request.body, request.get_json)
+    return make_json_response(await run_db(create_employees_result, employees, serializer))
+
+
+async def get_employees_with_filter(request, serializer):
+    filters = check_filters(request.get_json())
+    limit, after_id = staff.check_pagination(request.args)
+
+    return await respond_employees_page(request, serializer, filters, limit, after_id)
+
+
+async def search_employees(request, serializer):
+    search_query = staff.make_search_query(request.args.get('q'))
+    limit, after = staff.check_search_pagination(request.args)
+
+    return await respond_search_page(serializer, search_query, [], limit, after)
+
+
+async def search_employees_with_filter(request, serializer):
+    filters = check_filters(request.get_json())
+    search_query = staff.make_search_query(request.args.get('q'))
+    limit, after = staff.check_search_pagination(request.args)
+
+    return await respond_search_page(serializer, search_query, filters, limit, after)
+
+
+async def delete_employees(request, serializer):
+    await run_db(queries.delete_all)
+    return make_json_response({'result': True})
+
+
+async def delete_employee(request, serializer, employee_id):
+    result, code = await run_db(delete_employee_result, employee_id, serializer)
+    return make_json_response(result, code)
+
+
+async def delete_employees_with_filter(request, serializer):
+    filters = check_filters(request.get_json())
+
+    result, code = await run_db(delete_employees_result, filters, serializer)
+    return make_json_response(result, code)
+
+
+async def get_metrics(request, serializer):
+    if not flask_app.config['METRICS_ENABLED']:
+        raise NotFound()
+
+    return Response(metrics.render(queries).encode('utf-8'), mimetype=metrics_content_type)
+
+
+async def sql_profile(request, serializer):
+    profiler = queries.profiler
+    if profiler is None:
+        raise NotFound()
+
+    if not is_admin(Authorization.from_header(request.headers.get('authorization')), flask_app.config):
+        response = make_json_response({'error': 'Unauthorized'}, 401)
+        response.headers.append(('WWW-Authenticate', 'Basic realm="admin"'))
+        return response
+
+    if request.method == 'DELETE':
+        profiler.reset()
+        return make_json_response({'result': True})
+
+    return make_json_response(profiler.report())
+
+
+# endpoints of Flask application, so both variants share URL rules
+routes = {
+    'api.get_employees': get_employees,
+    'api.get_employee': get_employee,
+    'api.create_employee': create_employee,
+    'api.create_employees': create_employees,
+    'api.get_employees_with_filter': get_employees_with_filter,
+    'api.search_employees': search_employees,
+    'api.search_employees_with_filter': search_employees_with_filter,
+    'api.delete_employees': delete_employees,
+    'api.delete_employee': delete_employee,
+    'api.delete_employees_with_filter': delete_employees_with_filter,
+    'api.get_metrics': get_metrics,
+    'api.sql_profile': sql_profile
+}
+# -------------- #
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+async def dispatch(request):
+    adapter = flask_app.url_map.bind(
+        request.host,
+        script_name=request.root_path or None,
+        url_scheme=request.scheme
+    )
+
+    try:
+        endpoint, view_args = adapter.match(request.path, request.method)
+        stats = request_stats.get()
+        if stats is not None:
+            stats.endpoint = endpoint
+
+        if request.method == 'OPTIONS':
+            return Response(headers=[('Allow', ', '.join(adapter.allowed_methods(request.path)))], mimetype=None)
+
+        return await routes[endpoint](request, make_serializer(adapter), **view_args)
+    except HTTPException as err:
+        return make_error_response(err)
+    except PoolTimeoutError:
+        return make_json_response({'error': 'Database unavailable'}, 503)
+    except Exception:
+        flask_app.logger.exception('Exception on %s [%s]', request.path, request.method)
+        return make_error_response(InternalServerError())
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=True)
+            queries.close_connections()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    stats = metrics.start_request() if flask_app.config['METRICS_ENABLED'] else None
+    request_stats.set(stats)
+    try:
+        request = Request(scope, await read_body(receive))
+        response = await dispatch(request)
+        if stats is not None:
+            stats.status = response.status
+        await response.send(send, is_head=request.method == 'HEAD')
+    finally:
+        if stats is not None:
+            metrics.finish_request(stats, scope['method'])
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=5000)
@@ -0,0 +1,114 @@
+from os.path import abspath, dirname
+from threading import Thread, Lock
+from time import perf_counter
+import itertools
+import random
+import sys
+
+sys.path.insert(0, dirname(dirname(abspath(__file__))))
+
+from flask import Flask
+from db.queries import Queries
+import staff
+
+name_counter = itertools.count(1)
+name_counter_lock = Lock()
+
+
+def make_queries(database, **config):
+    app = Flask('benchmark')
+    app.config.update(DATABASE=database, **config)
+    queries = Queries(app)
+    app.teardown_appcontext(lambda error: queries.close_db())
+    return app, queries
+
+
+def random_date(start_year, stop_year):
+    return staff.convert_date_to_str(
+        staff.datetime(random.randint(start_year, stop_year), random.randint(1, 12), random.randint(1, 28))
+    )
+
+
+# payloads of the stress scenarios in tests/load.py
+def stress_employee():
+    with name_counter_lock:
+        number = next(name_counter)
+    return {
+        'name': 'user_' + str(number).zfill(7),
+        'birthdate': random_date(1960, 2001),
+        'position': 'user_pos_' + str(random.randint(1, 99)).zfill(2),
+        'enrollmentdate': random_date(2000, 2018)
+    }
+
+
+def stress_filters():
+    return [
+        {'key': 'age', 'expr': '>=', 'value': '20'},
+        {'key': 'age', 'expr': '<', 'value': '40'},
+        {'key': 'experience', 'expr': '>', 'value': '3'},
+        {'key': 'experience', 'expr': '<=', 'value': '15'},
+        {'key': 'position', 'expr': '!=', 'value': 'user_pos_' + str(random.randint(1, 99)).zfill(2)}
+    ]
+
+
+def seed_employees(app, queries, number, batch=10000):
+    with app.app_context():
+        for start in range(0, number, batch):
+            queries.insert_employees([stress_employee() for i in range(min(batch, number - start))])
+
+
+def percentile(values, percent):
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))]
+
+
+def summarize(latencies, seconds):
+    return {
+        'ops': len(latencies),
+        'seconds': round(seconds, 4),
+        'ops_per_sec': round(len(latencies) / seconds, 2) if seconds > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_ms': round(max(latencies) * 1000, 3) if latencies else 0.0
+    }
+
+
+def run_threads(app, action, threads, loops):
+    latencies = []
+    errors = []
+    lock = Lock()
+
+    def worker():
+        local_latencies = []
+        for i in range(loops):
+            started = perf_counter()
+            try:
+                with app.app_context():
+                    action()
+            except Exception as err:
+                with lock:
+                    errors.append(repr(err))
+                continue
+            local_latencies.append(perf_counter() - started)
+        with lock:
+            latencies.extend(local_latencies)
+
+    workers = [Thread(target=worker) for i in range(threads)]
+    started = perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    result = summarize(latencies, perf_counter() - started)
+    result['errors'] = len(errors)
+    return result
+
+
+def print_table(rows, columns):
+    widths = [max(len(str(c)), max([len(str(r.get(c, ''))) for r in rows] + [0])) for c in columns]
+    print('  '.join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for r in rows:
+        print('  '.join(str(r.get(c, '')).ljust(w) for c, w in zip(columns, widths)))
@@ -0,0 +1,112 @@
+from argparse import ArgumentParser
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Lock
+from json import dumps
+import random
+
+from common import make_queries, seed_employees, run_threads, print_table
+from app import create_app
+
+# cache of each mode holds all employees or nothing
+modes = {
+    'hit': 1000000,
+    'miss': 0
+}
+# reads by Queries method or by GET of employee route, with ETag lookup and serialization
+levels = ['queries', 'http']
+
+
+def count_statements(queries):
+    # statements run on pooled connections and checkouts of them, health checks included
+    counter = {'statements': 0, 'checkouts': 0}
+    lock = Lock()
+    acquire = queries.pool.acquire
+
+    def trace(statement):
+        with lock:
+            counter['statements'] += 1
+
+    def connect():
+        connection = queries.connect_db()
+        connection.set_trace_callback(trace)
+        return connection
+
+    def counted_acquire():
+        with lock:
+            counter['checkouts'] += 1
+        return acquire()
+
+    queries.pool.connect = connect
+    queries.pool.acquire = counted_acquire
+    return counter
+
+
+def make_read(level, app, queries):
+    if level == 'queries':
+        return queries.select_employee_by_id
+
+    client = app.test_client()
+    return lambda id: client.get('/api/v1/employees/' + str(id))
+
+
+def run_mode(level, mode, size, threads, loops, seed_value):
+    random.seed(seed_value)
+    directory = mkdtemp()
+    try:
+        database = join(directory, 'benchmark.db')
+        if level == 'queries':
+            app, queries = make_queries(database, EMPLOYEE_CACHE_SIZE=modes[mode])
+        else:
+            app = create_app({'DATABASE': database, 'EMPLOYEE_CACHE_SIZE': modes[mode]})
+            queries = app.extensions['queries']
+        seed_employees(app, queries, size)
+        ids = list(range(1, size + 1))
+        read = make_read(level, app, queries)
+
+        # warm up, every employee is read once
+        for id in ids:
+            with app.app_context():
+                read(id)
+
+        queries.close_connections()
+        counter = count_statements(queries)
+        result = run_threads(app, lambda: read(random.choice(ids)), threads, loops)
+        for key in ['statements', 'checkouts']:
+            result[key + '_per_op'] = round(counter[key] / float(result['ops']), 2) if result['ops'] else 0.0
+        result['level'] = level
+        result['mode'] = mode
+        result['employees'] = size
+        queries.close_connections()
+        return result
+    finally:
+        rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Reads of employees by id with and without hits of employee cache')
+    parser.add_argument('--employees', type=int, default=10000)
+    parser.add_argument('--levels', nargs='+', choices=levels, default=levels)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--loops', type=int, default=20000, help='Reads of each thread')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Path of JSON file with results')
+    args = parser.parse_args()
+
+    results = []
+    for level in args.levels:
+        for threads in args.threads:
+            for mode in sorted(modes):
+                result = run_mode(level, mode, args.employees, threads, args.loops, args.seed)
+                result['threads'] = threads
+                results.append(result)
+
+    print_table(results, [
+        'employees', 'level', 'threads', 'mode', 'ops_per_sec', 'p50_ms', 'p95_ms', 'p99_ms',
+        'statements_per_op', 'checkouts_per_op', 'errors'
+    ])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(dumps(results, indent=4))
@@ -0,0 +1,89 @@
+from argparse import ArgumentParser
+from time import perf_counter
+from json import dumps, loads
+from flask import Flask, url_for
+from flask.json.provider import DefaultJSONProvider
+
+from common import stress_employee, print_table
+from serialization import EmployeeSerializer, make_json_provider, orjson
+import staff
+
+
+# employees page as built before serialization layer: url_for per row, pretty printed in debug mode
+def make_public_employee(employee):
+    new_employee = {}
+    for col in employee:
+        if col == 'id':
+            new_employee['uri'] = url_for('get_employee', employee_id=employee['id'], _external=True)
+        else:
+            new_employee[col] = employee[col]
+    return new_employee
+
+
+def serialize_with_url_for(app, employees):
+    return app.json.response({'employees': list(map(make_public_employee, employees))}).get_data()
+
+
+def serialize_with_serializer(app, employees):
+    serializer = EmployeeSerializer(url_for('get_employee', employee_id=0, _external=True))
+    return app.json.response({'employees': serializer.make_public_employees(employees)}).get_data()
+
+
+def measure(app, func, employees, repeats):
+    timings = []
+    with app.test_request_context(base_url='http://localhost:5000'):
+        for i in range(repeats):
+            started = perf_counter()
+            body = func(app, employees)
+            timings.append(perf_counter() - started)
+    return min(timings), body
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Serialization of employees pages against per-row url_for and jsonify')
+    parser.add_argument('--employees', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--repeats', type=int, default=5, help='Best of N runs is reported')
+    parser.add_argument('--output', help='Path of JSON file with results')
+    args = parser.parse_args()
+
+    app = Flask('benchmark')
+    app.config['DEBUG'] = True
+    app.add_url_rule(staff.Routes.api_employee, 'get_employee', lambda employee_id: '')
+
+    encoders = ['json'] if orjson is None else ['json', 'orjson']
+    providers = dict((encoder, make_json_provider(app, encoder)) for encoder in encoders)
+
+    results = []
+    for number in args.employees:
+        employees = [dict(stress_employee(), id=id) for id in range(1, number + 1)]
+
+        app.json = DefaultJSONProvider(app)
+        baseline_time, expected = measure(app, serialize_with_url_for, employees, args.repeats)
+        results.append({
+            'employees': number,
+            'path': 'url_for + jsonify',
+            'ms': round(baseline_time * 1000, 2),
+            'rows_per_sec': int(number / baseline_time),
+            'bytes': len(expected),
+            'speedup': 1.0
+        })
+
+        for encoder in encoders:
+            app.json = providers[encoder]
+            serializer_time, received = measure(app, serialize_with_serializer, employees, args.repeats)
+            assert loads(expected) == loads(received), 'Serialized employees differ!'
+
+            results.append({
+                'employees': number,
+                'path': 'serializer + ' + encoder,
+                'ms': round(serializer_time * 1000, 2),
+                'rows_per_sec': int(number / serializer_time),
+                'bytes': len(received),
+                'speedup': round(baseline_time / serializer_time, 2)
+            })
+
+    print_table(results, ['employees', 'path', 'ms', 'rows_per_sec', 'bytes', 'speedup'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(dumps(results, indent=4))
@@ -0,0 +1,68 @@
+from argparse import ArgumentParser
+from time import perf_counter
+from json import dumps
+
+from common import stress_employee, print_table
+import staff
+
+
+def filter_with_comparisons(employees, filters_list):
+    filtered_employees = []
+    for employee in employees:
+        for filt in filters_list:
+            if not staff.is_correct_comparison(
+                    employee[staff.filter_columns[filt['key']]],
+                    filt['expr'],
+                    filt['value'],
+                    is_date=filt['key'] != 'position'
+            ):
+                break
+        else:
+            filtered_employees.append(employee)
+    return filtered_employees
+
+
+def filter_with_predicate(employees, filters_list):
+    return list(filter(staff.compile_filters(filters_list), employees))
+
+
+def measure(func, employees, filters_lists):
+    started = perf_counter()
+    results = [func(employees, filters_list) for filters_list in filters_lists]
+    return perf_counter() - started, results
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Compiled filter predicates against is_correct_comparison')
+    parser.add_argument('--employees', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--filters', type=int, default=20, help='Number of random filters lists')
+    parser.add_argument('--output', help='Path of JSON file with results')
+    args = parser.parse_args()
+
+    results = []
+    for number in args.employees:
+        employees = [stress_employee() for i in range(number)]
+        filters_lists = []
+        while len(filters_lists) < args.filters:
+            filters_list = staff.FilterGenerator().generate_filters_list(employees, start=1)
+            if len([f for f in filters_list if f['key'] == 'position']) <= 1:
+                filters_lists.append(filters_list)
+
+        staff.convert_str_to_date_key.cache_clear()
+        comparisons_time, expected = measure(filter_with_comparisons, employees, filters_lists)
+        predicate_time, received = measure(filter_with_predicate, employees, filters_lists)
+        assert expected == received, 'Filtration results differ!'
+
+        results.append({
+            'employees': number,
+            'filters_lists': len(filters_lists),
+            'comparisons_sec': round(comparisons_time, 4),
+            'predicate_sec': round(predicate_time, 4),
+            'speedup': round(comparisons_time / predicate_time, 2)
+        })
+
+    print_table(results, ['employees', 'filters_lists', 'comparisons_sec', 'predicate_sec', 'speedup'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(dumps(results, indent=4))
@@ -0,0 +1,158 @@
+from argparse import ArgumentParser
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+from json import dumps
+import random
+import sqlite3
+
+from common import make_queries, stress_employee, summarize, print_table
+
+levels = ['Junior', 'Middle', 'Senior', 'Lead', 'Principal']
+roles = ['python developer', 'QA/QC engineer', 'project manager', 'system administrator', 'data analyst']
+# positions as before lookup table, without and with index on the column
+inline_layouts = {
+    'inline': [],
+    'inline_indexed': ['create index employees_position on employees (position)']
+}
+inline_statements = {
+    '=': 'select id, name, birthdate, position, enrollmentdate from employees where position = ? order by id',
+    '!=': 'select id, name, birthdate, position, enrollmentdate from employees where position != ? order by id'
+}
+
+
+def make_positions(number):
+    return [
+        levels[index % len(levels)] + ' ' + roles[index // len(levels) % len(roles)] +
+        ', team ' + str(index // (len(levels) * len(roles)) + 1)
+        for index in range(number)
+    ]
+
+
+def seed(app, queries, number, positions, batch=10000):
+    with app.app_context():
+        for start in range(0, number, batch):
+            employees = [stress_employee() for i in range(min(batch, number - start))]
+            for employee in employees:
+                employee['position'] = random.choice(positions)
+            queries.insert_employees(employees)
+
+
+def make_inline_database(path, lookup_path, statements):
+    db = sqlite3.connect(path)
+    db.execute('attach database ? as lookup', [lookup_path])
+    db.execute(
+        'create table employees ('
+        'id integer primary key autoincrement, name VARCHAR not null, birthdate VARCHAR not null, '
+        'position VARCHAR not null, enrollmentdate VARCHAR not null, birthdate_iso VARCHAR not null, '
+        'enrollmentdate_iso VARCHAR not null, revision integer not null default 0)'
+    )
+    db.execute(
+        'insert into employees select id, name, birthdate, position, enrollmentdate, '
+        'birthdate_iso, enrollmentdate_iso, revision '
+        'from lookup.employees join lookup.positions using (position_id) order by id'
+    )
+    db.execute('create unique index employees_name_birthdate on employees (name, birthdate)')
+    db.execute('create index employees_birthdate_iso on employees (birthdate_iso)')
+    db.execute('create index employees_enrollmentdate_iso on employees (enrollmentdate_iso)')
+    for statement in statements:
+        db.execute(statement)
+    db.commit()
+    db.execute('detach database lookup')
+    db.execute('vacuum')
+    return db
+
+
+def get_storage_kb(db):
+    # pages of employees and positions tables with their indexes, full-text index is the same in all layouts
+    try:
+        size = db.execute(
+            'select sum(pgsize) from dbstat where name in '
+            '(select name from sqlite_master where tbl_name in (\'employees\', \'positions\'))'
+        ).fetchone()[0]
+    except sqlite3.OperationalError:
+        # SQLite without dbstat, whole file
+        size = db.execute('pragma page_count').fetchone()[0] * db.execute('pragma page_size').fetchone()[0]
+    return round(size / 1024.0, 1)
+
+
+def measure_inline(db, expr, positions, ops):
+    latencies = []
+    for i in range(ops):
+        started = perf_counter()
+        db.execute(inline_statements[expr], [random.choice(positions)]).fetchall()
+        latencies.append(perf_counter() - started)
+    return summarize(latencies, sum(latencies))
+
+
+def measure_lookup(db, queries, expr, positions, ops):
+    # the same statements as position filters of Queries, with resolution of position id
+    latencies = []
+    for i in range(ops):
+        filters_list = [{'key': 'position', 'expr': expr, 'value': random.choice(positions)}]
+        started = perf_counter()
+        db.execute(*queries.get_filtration_statement('select', queries.resolve_positions(db, filters_list))).fetchall()
+        latencies.append(perf_counter() - started)
+    return summarize(latencies, sum(latencies))
+
+
+def run_size(size, positions_number, ops, seed_value):
+    random.seed(seed_value)
+    positions = make_positions(positions_number)
+    directory = mkdtemp()
+    try:
+        lookup_path = join(directory, 'lookup.db')
+        app, queries = make_queries(lookup_path, EMPLOYEE_CACHE_SIZE=0, FILTER_CACHE_SIZE=0)
+        seed(app, queries, size, positions)
+        queries.close_connections()
+
+        lookup_db = sqlite3.connect(lookup_path)
+        lookup_db.execute('vacuum')
+
+        results = []
+        for layout, statements in sorted(inline_layouts.items()):
+            db = make_inline_database(join(directory, layout + '.db'), lookup_path, statements)
+            result = {'employees': size, 'positions': positions_number, 'layout': layout, 'storage_kb': get_storage_kb(db)}
+            for expr in ['=', '!=']:
+                result[expr] = measure_inline(db, expr, positions, ops)
+            db.close()
+            results.append(result)
+
+        result = {'employees': size, 'positions': positions_number, 'layout': 'lookup', 'storage_kb': get_storage_kb(lookup_db)}
+        for expr in ['=', '!=']:
+            result[expr] = measure_lookup(lookup_db, queries, expr, positions, ops)
+        lookup_db.close()
+        results.append(result)
+
+        return results
+    finally:
+        rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Storage and position filters of positions lookup table against inline column')
+    parser.add_argument('--employees', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--positions', type=int, default=300, help='Number of distinct positions')
+    parser.add_argument('--ops', type=int, default=50, help='Filtrations of each kind')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Path of JSON file with results')
+    args = parser.parse_args()
+
+    results = []
+    for size in args.employees:
+        results.extend(run_size(size, args.positions, args.ops, args.seed))
+
+    rows = []
+    for result in results:
+        row = dict((key, result[key]) for key in ['employees', 'positions', 'layout', 'storage_kb'])
+        row['eq_p50_ms'] = result['=']['p50_ms']
+        row['eq_p95_ms'] = result['=']['p95_ms']
+        row['ne_p50_ms'] = result['!=']['p50_ms']
+        row['ne_p95_ms'] = result['!=']['p95_ms']
+        rows.append(row)
+    print_table(rows, ['employees', 'positions', 'layout', 'storage_kb', 'eq_p50_ms', 'eq_p95_ms', 'ne_p50_ms', 'ne_p95_ms'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(dumps(results, indent=4))
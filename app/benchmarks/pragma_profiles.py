@@ -0,0 +1,57 @@
+from argparse import ArgumentParser
+from os.path import join
+from shutil import rmtree
+from tempfile import mkdtemp
+from json import dumps
+
+from common import make_queries, seed_employees, stress_employee, stress_filters, run_threads, print_table
+from db.queries import pragma_profiles
+
+
+# the four stress scenarios of tests/load.py, driven through Queries directly
+scenarios = {
+    'test_stress_insert': (0, lambda queries: queries.insert_employee(stress_employee())),
+    'test_stress_get_all': (1000, lambda queries: queries.select_all()),
+    'test_stress_get_filtered': (1000, lambda queries: queries.select_with_filtration(stress_filters())),
+    'test_stress_delete_all': (0, lambda queries: queries.delete_all())
+}
+
+
+def run_scenario(profile, scenario, threads, loops):
+    directory = mkdtemp()
+    try:
+        app, queries = make_queries(
+            join(directory, 'benchmark.db'),
+            SQLITE_PROFILE=profile,
+            DATABASE_POOL_SIZE=threads
+        )
+        seed_number, action = scenarios[scenario]
+        seed_employees(app, queries, seed_number)
+
+        result = run_threads(app, lambda: action(queries), threads, loops)
+        result['profile'] = profile
+        result['scenario'] = scenario
+        return result
+    finally:
+        rmtree(directory)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Throughput of SQLite PRAGMA profiles on the stress scenarios')
+    parser.add_argument('--profiles', nargs='+', default=sorted(pragma_profiles.keys()))
+    parser.add_argument('--scenarios', nargs='+', default=list(scenarios.keys()))
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--loops', type=int, default=50)
+    parser.add_argument('--output', help='Path of JSON file with results')
+    args = parser.parse_args()
+
+    results = []
+    for scenario in args.scenarios:
+        for profile in args.profiles:
+            results.append(run_scenario(profile, scenario, args.threads, args.loops))
+
+    print_table(results, ['scenario', 'profile', 'ops', 'ops_per_sec', 'p50_ms', 'p95_ms', 'p99_ms', 'errors'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(dumps(results, indent=4))
@@ -0,0 +1,187 @@
+from argparse import ArgumentParser
+from os.path import abspath, dirname, join
+from shutil import copyfile, rmtree
+from tempfile import mkdtemp
+from time import perf_counter, time
+from json import dumps, loads
+import platform
+import random
+import sqlite3
+import subprocess
+import tracemalloc
+
+from common import make_queries, seed_employees, stress_employee, stress_filters, summarize, print_table
+
+# caches would measure dictionaries instead of the data layer
+benchmark_config = {
+    'EMPLOYEE_CACHE_SIZE': 0,
+    'FILTER_CACHE_SIZE': 0
+}
+memory_ops = 3
+
+
+def make_filtration(number):
+    # the stress filters list, position filter is the fifth
+    return lambda queries, size: queries.select_with_filtration(stress_filters()[:number])
+
+
+def make_search(is_prefix):
+    # full page of relevance-ranked results, words of stress employees are numbers of names and positions
+    if is_prefix:
+        return lambda queries, size: queries.search_employees(
+            '"' + str(random.randint(1, size)).zfill(7)[:5] + '"*', limit=21
+        )
+    return lambda queries, size: queries.search_employees('"' + str(random.randint(1, 99)).zfill(2) + '"', limit=21)
+
+
+def prepare_delete_employees(queries):
+    employee = stress_employee()
+    employee['position'] = 'benchmark_' + employee['name']
+    queries.insert_employee(employee)
+    return [[{'key': 'position', 'expr': '=', 'value': employee['position']}]]
+
+
+# (method, action, preparation run untimed before each call)
+methods = [
+    ('select_all', lambda queries, size: queries.select_all(), None),
+    ('select_employee_by_id', lambda queries, size: queries.select_employee_by_id(random.randint(1, size)), None)
+] + [
+    ('select_with_filtration_' + str(number), make_filtration(number), None) for number in range(1, 6)
+] + [
+    ('search_employees', make_search(False), None),
+    ('search_employees_prefix', make_search(True), None),
+    ('insert_employee', lambda queries, size: queries.insert_employee(stress_employee()), None),
+    (
+        'delete_employees',
+        lambda queries, size, filters_list: queries.delete_employees(filters_list),
+        prepare_delete_employees
+    ),
+    ('delete_all', lambda queries, size: queries.delete_all(), None)
+]
+
+
+def get_commit():
+    directory = dirname(abspath(__file__))
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=directory, stderr=subprocess.DEVNULL)
+        status = subprocess.check_output(['git', 'status', '--porcelain'], cwd=directory, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.decode().strip(), len(status.strip()) > 0
+
+
+def call(app, queries, size, action, prepare):
+    with app.app_context():
+        args = prepare(queries) if prepare else []
+        started = perf_counter()
+        action(queries, size, *args)
+        return perf_counter() - started
+
+
+def measure_time(app, queries, size, action, prepare, ops, max_seconds):
+    latencies = []
+    spent = 0.0
+    while len(latencies) < ops and (spent < max_seconds or len(latencies) == 0):
+        latencies.append(call(app, queries, size, action, prepare))
+        spent += latencies[-1]
+    return summarize(latencies, spent)
+
+
+def measure_memory(app, queries, size, action, prepare, ops):
+    # separate pass, tracing slows down every allocation
+    peak = 0
+    tracemalloc.start()
+    try:
+        for i in range(ops):
+            with app.app_context():
+                args = prepare(queries) if prepare else []
+                tracemalloc.reset_peak()
+                action(queries, size, *args)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024.0, 1)
+
+
+def run_size(size, ops, max_seconds, seed):
+    random.seed(seed)
+    directory = mkdtemp()
+    try:
+        database = join(directory, 'benchmark.db')
+        app, queries = make_queries(database, **benchmark_config)
+        started = perf_counter()
+        seed_employees(app, queries, size)
+        seed_seconds = perf_counter() - started
+
+        # copy of seeded database for memory pass of delete_all
+        queries.close_connections()
+        copyfile(database, join(directory, 'copy.db'))
+
+        results = []
+        for name, action, prepare in methods:
+            if name == 'delete_all':
+                result = measure_time(app, queries, size, action, prepare, 1, 0)
+                copy_app, copy_queries = make_queries(join(directory, 'copy.db'), **benchmark_config)
+                result['peak_memory_kb'] = measure_memory(copy_app, copy_queries, size, action, prepare, 1)
+                copy_queries.close_connections()
+            else:
+                result = measure_time(app, queries, size, action, prepare, ops, max_seconds)
+                result['peak_memory_kb'] = measure_memory(app, queries, size, action, prepare, memory_ops)
+
+            result['employees'] = size
+            result['method'] = name
+            results.append(result)
+
+        queries.close_connections()
+        return seed_seconds, results
+    finally:
+        rmtree(directory)
+
+
+def compare(results, baseline):
+    baseline_results = dict(((r['employees'], r['method']), r) for r in baseline['results'])
+    for result in results:
+        previous = baseline_results.get((result['employees'], result['method']))
+        if previous is not None and previous['ops_per_sec'] > 0:
+            result['change'] = '%+.1f%%' % ((result['ops_per_sec'] / previous['ops_per_sec'] - 1) * 100)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Queries methods at realistic table sizes')
+    parser.add_argument('--employees', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--ops', type=int, default=200, help='Maximum calls of each method')
+    parser.add_argument('--max-seconds', type=float, default=5, help='Time budget of each method')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Path of JSON file with results')
+    parser.add_argument('--compare', help='Path of JSON file with results of another run')
+    args = parser.parse_args()
+
+    commit, is_dirty = get_commit()
+    report = {
+        'commit': commit,
+        'dirty': is_dirty,
+        'started': time(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'config': benchmark_config,
+        'seed': args.seed,
+        'seeding_seconds': {},
+        'results': []
+    }
+
+    for size in args.employees:
+        seed_seconds, results = run_size(size, args.ops, args.max_seconds, args.seed)
+        report['seeding_seconds'][str(size)] = round(seed_seconds, 2)
+        report['results'].extend(results)
+
+    columns = ['employees', 'method', 'ops', 'ops_per_sec', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms', 'peak_memory_kb']
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report['results'], loads(f.read()))
+        columns.append('change')
+
+    print_table(report['results'], columns)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(dumps(report, indent=4))
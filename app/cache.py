@@ -0,0 +1,103 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from threading import Lock
+from time import time
+
+
+class LRUCache(object):
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return True, self.entries[key]
+            self.misses += 1
+            return False, None
+
+    def get_version(self):
+        return self.version
+
+    def put(self, key, value, version=None):
+        # values read before a concurrent invalidation are dropped
+        if self.capacity <= 0:
+            return
+
+        with self.lock:
+            if version is not None and version != self.version:
+                return
+
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys):
+        with self.lock:
+            self.version += 1
+            for key in keys:
+                self.entries.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.version += 1
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'capacity': self.capacity,
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+class ResultCache(LRUCache):
+
+    def __init__(self, capacity, ttl):
+        LRUCache.__init__(self, capacity)
+        self.ttl = ttl
+        self.expirations = 0
+
+    def get_expiration_time(self):
+        # ages and experiences change at local midnight
+        midnight = datetime.combine(date.today() + timedelta(days=1), datetime.min.time())
+        return min(time() + self.ttl, midnight.timestamp())
+
+    def get(self, key, generation):
+        with self.lock:
+            if key in self.entries:
+                entry_generation, expires_at, value = self.entries[key]
+                if entry_generation == generation and time() < expires_at:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+
+                del self.entries[key]
+                self.expirations += 1
+
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, generation, expires_at):
+        # expiration time is taken before the value is computed, values of the previous day expire at once
+        LRUCache.put(self, key, (generation, expires_at, value))
+
+    def stats(self):
+        stats = LRUCache.stats(self)
+        with self.lock:
+            stats['expirations'] = self.expirations
+            stats['ttl'] = self.ttl
+        return stats
@@ -0,0 +1,90 @@
+from threading import Condition
+import sqlite3
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+class ConnectionPool(object):
+
+    def __init__(self, connect, size=16, timeout=30):
+        self.connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.idle = []
+        self.opened = 0
+        self.condition = Condition()
+
+    def acquire(self):
+        while True:
+            with self.condition:
+                if len(self.idle) == 0 and self.opened >= self.size:
+                    if not self.condition.wait_for(
+                            lambda: len(self.idle) > 0 or self.opened < self.size,
+                            self.timeout
+                    ):
+                        raise PoolTimeoutError(
+                            'No free database connection in ' + str(self.timeout) + ' seconds'
+                        )
+
+                if len(self.idle) > 0:
+                    connection = self.idle.pop()
+                else:
+                    self.opened += 1
+                    connection = None
+
+            if connection is None:
+                try:
+                    return self.connect()
+                except Exception:
+                    self.forget()
+                    raise
+
+            if self.is_healthy(connection):
+                return connection
+
+            self.discard(connection)
+
+    def release(self, connection):
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+        except sqlite3.Error:
+            self.discard(connection)
+            return
+
+        with self.condition:
+            self.idle.append(connection)
+            self.condition.notify()
+
+    def is_healthy(self, connection):
+        try:
+            connection.execute('select 1').fetchall()
+            return not connection.in_transaction
+        except sqlite3.Error:
+            return False
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+        self.forget()
+
+    def forget(self):
+        with self.condition:
+            self.opened -= 1
+            self.condition.notify()
+
+    def close_all(self):
+        with self.condition:
+            idle, self.idle = self.idle, []
+            self.opened -= len(idle)
+            self.condition.notify_all()
+
+        for connection in idle:
+            try:
+                connection.close()
+            except sqlite3.Error:
+                pass
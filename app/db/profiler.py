@@ -0,0 +1,101 @@
+from collections import deque
+from json import dumps
+from threading import Lock
+from time import time
+import re
+import sqlite3
+
+string_literal = re.compile(r"'(?:[^']|'')*'")
+number_literal = re.compile(r'\b\d+(?:\.\d+)?\b')
+values_list = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+whitespace = re.compile(r'\s+')
+explained_statements = ('select', 'delete', 'update', 'insert', 'with')
+max_normalized_statements = 1024
+
+
+def normalize_statement(query):
+    query = string_literal.sub('?', query)
+    query = number_literal.sub('?', query)
+    query = values_list.sub('(...)', query)
+    return whitespace.sub(' ', query).strip()
+
+
+class StatementProfiler(object):
+
+    def __init__(self, slow_threshold, slow_log_size):
+        self.slow_threshold = slow_threshold
+        self.lock = Lock()
+        # normalized text by raw statement, the same strings are executed again and again
+        self.normalized = {}
+        self.statements = {}
+        self.slow_log = deque(maxlen=slow_log_size)
+
+    def normalize(self, query):
+        normalized = self.normalized.get(query)
+        if normalized is None:
+            normalized = normalize_statement(query)
+            if len(self.normalized) < max_normalized_statements:
+                self.normalized[query] = normalized
+        return normalized
+
+    def record(self, db, query, params, seconds, rows):
+        normalized = self.normalize(query)
+
+        with self.lock:
+            stats = self.statements.get(normalized)
+            if stats is None:
+                stats = self.statements[normalized] = {
+                    'statement': normalized,
+                    'count': 0,
+                    'total_seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'rows': 0
+                }
+            stats['count'] += 1
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['rows'] += rows
+
+        if seconds >= self.slow_threshold:
+            self.log_slow(db, query, params, normalized, seconds, rows)
+
+    def log_slow(self, db, query, params, normalized, seconds, rows):
+        plan = []
+        if query.lstrip().lower().startswith(explained_statements):
+            try:
+                plan = [r[3] for r in db.execute('explain query plan ' + query, params or ()).fetchall()]
+            except sqlite3.Error:
+                pass
+
+        with self.lock:
+            self.slow_log.append({
+                'time': time(),
+                'statement': normalized,
+                'seconds': seconds,
+                'rows': rows,
+                'plan': plan,
+                # tables read without index, the usual reason of slow statements
+                'full_scans': [p for p in plan if p.startswith('SCAN ') and ' USING ' not in p]
+            })
+
+    def report(self):
+        with self.lock:
+            statements = [dict(s) for s in self.statements.values()]
+            slow_log = list(self.slow_log)
+
+        for stats in statements:
+            stats['mean_seconds'] = stats['total_seconds'] / stats['count']
+        return {
+            'slow_threshold': self.slow_threshold,
+            'statements': sorted(statements, key=lambda s: s['total_seconds'], reverse=True),
+            'slow': slow_log
+        }
+
+    def reset(self):
+        with self.lock:
+            self.statements = {}
+            self.slow_log.clear()
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            f.write(dumps(self.report(), indent=4))
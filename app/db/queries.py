@@ -1,173 +1,876 @@
-from os.path import join, abspath, dirname, exists
-from flask import g
+from os.path import join, abspath, dirname
+from contextlib import contextmanager
+from tempfile import gettempdir
+from collections import OrderedDict
+from itertools import islice
+from threading import Lock
+from time import perf_counter
+from flask import g, has_app_context
+from db.pool import ConnectionPool
+from db.snapshot import EmployeeSnapshot
+from db.profiler import StatementProfiler
+from cache import LRUCache, ResultCache
 import sqlite3
 import staff
 
+pragma_profiles = {
+    'legacy': {
+        'busy_timeout': 5000,
+        'journal_mode': 'delete',
+        'synchronous': 'full'
+    },
+    'durable': {
+        'busy_timeout': 5000,
+        'journal_mode': 'wal',
+        'synchronous': 'full',
+        'cache_size': -16384,
+        'mmap_size': 0,
+        'temp_store': 'default'
+    },
+    'fast': {
+        'busy_timeout': 5000,
+        'journal_mode': 'wal',
+        'synchronous': 'normal',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'memory'
+    }
+}
+
 class Queries(object):
 
     def __init__(self, app):
         self.app_handler = app
         self.database_name = 'rest_app.db'
-        self.app_handler.config.update(dict(
+        defaults = dict(
             DATABASE=join(app.root_path, self.database_name),
             DEBUG=True,
             SECRET_KEY='development key',
             USERNAME='admin',
-            PASSWORD='default'
-        ))
+            PASSWORD='default',
+            DATABASE_POOL_SIZE=16,
+            DATABASE_POOL_TIMEOUT=30,
+            SQLITE_PROFILE='durable',
+            SQLITE_PRAGMAS={},
+            SQLITE_CACHED_STATEMENTS=256,
+            STATEMENT_CACHE_SIZE=1024,
+            FILTER_ENGINE='sql',
+            EMPLOYEE_CACHE_SIZE=1024,
+            FILTER_CACHE_SIZE=256,
+            FILTER_CACHE_TTL=60,
+            FILTER_CACHE_MAX_ROWS=10000,
+            JSON_ENCODER='auto',
+            METRICS_ENABLED=True,
+            SQL_PROFILER=False,
+            SQL_SLOW_THRESHOLD=0.1,
+            SQL_SLOW_LOG_SIZE=100,
+            SQL_PROFILE_DUMP=None,
+            REQUEST_PROFILER='off',
+            PROFILE_SAMPLE_PERCENT=0,
+            PROFILE_SLOW_THRESHOLD=0.5,
+            PROFILE_DIR=join(gettempdir(), 'rest_app_profiles'),
+            PROFILE_DIR_MAX_FILES=100,
+            PROFILE_FORMAT='pstats'
+        )
+        for key in defaults:
+            if self.app_handler.config.get(key) is None:
+                self.app_handler.config[key] = defaults[key]
         self.app_handler.config.from_envvar('APP_SETTINGS', silent=True)
 
-        self.employee_keys = ['name', 'birthdate', 'position', 'enrollmentdate']
+        self.pragmas = dict(pragma_profiles[self.app_handler.config['SQLITE_PROFILE']])
+        self.pragmas.update(self.app_handler.config['SQLITE_PRAGMAS'])
 
+        self.employee_keys = ['name', 'birthdate', 'position', 'enrollmentdate']
+        self.employee_columns = 'id, ' + ', '.join(self.employee_keys)
+        # positions are stored once in lookup table, employees refer to them by id
+        self.employees_source = 'employees join positions using (position_id)'
+        self.returning_columns = \
+            'id, name, birthdate, ' \
+            '(select position from positions where positions.position_id = employees.position_id) as position, ' \
+            'enrollmentdate'
+        self.insert_employee_query = \
+            'insert into employees ' \
+            '(name, birthdate, position_id, enrollmentdate, birthdate_iso, enrollmentdate_iso, revision) ' \
+            'values (?, ?, ?, ?, ?, ?, ?)'
+        # position id and next revision are taken by the insert itself, revision is moved on by trigger
+        self.insert_employee_select_query = \
+            'insert into employees ' \
+            '(name, birthdate, position_id, enrollmentdate, birthdate_iso, enrollmentdate_iso, revision) ' \
+            'select ?, ?, position_id, ?, ?, ?, (select revision + 1 from revisions where name = \'employees\') ' \
+            'from positions where position = ?'
+        self.fetch_size = 500
+        self.is_returning_supported = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+        self.statement_templates = {
+            'select': 'select ' + self.employee_columns + ' from ' + self.employees_source + ' {where} order by id {limit}',
+            'capture': 'select ' + self.employee_columns + ' from ' + self.employees_source + ' {where}',
+            'delete': 'delete from employees {where}',
+            'delete_returning': 'delete from employees {where} returning ' + self.returning_columns,
+            'unindex': 'insert into employees_fts (employees_fts, rowid, name, position) '
+                       'select \'delete\', id, name, position from ' + self.employees_source + ' {where}',
+            'search': 'select ' + self.employee_columns + ', match_rank from ' + self.employees_source + ' join '
+                      '(select rowid as match_id, rank as match_rank from employees_fts where employees_fts match ?) '
+                      'on match_id = id {where} order by match_rank, id {limit}'
+        }
+        self.statement_cache_size = self.app_handler.config['STATEMENT_CACHE_SIZE']
+
+        self.filter_engine = self.app_handler.config['FILTER_ENGINE']
+        if self.filter_engine not in ['sql', 'python', 'numpy']:
+            raise ValueError('Unknown filter engine \'' + str(self.filter_engine) + '\'')
+        self.filter_cache_max_rows = self.app_handler.config['FILTER_CACHE_MAX_ROWS']
+
+        # full-text index of employees, kept in sync by the triggers on insert and update,
+        # deleted employees are removed from it by the deleting methods
+        self.search_schema = [
+            'create view employees_content as '
+            'select id, name, position from employees join positions using (position_id)',
+            'create virtual table employees_fts using fts5('
+            'name, position, content=\'employees_content\', content_rowid=\'id\', '
+            'tokenize=\'unicode61 remove_diacritics 2\')',
+            'create trigger employees_fts_insert after insert on employees begin '
+            'insert into employees_fts (rowid, name, position) '
+            'select new.id, new.name, position from positions where position_id = new.position_id; '
+            'end',
+            'create trigger employees_fts_update after update of name, position_id on employees begin '
+            'insert into employees_fts (employees_fts, rowid, name, position) '
+            'select \'delete\', old.id, old.name, position from positions where position_id = old.position_id; '
+            'insert into employees_fts (rowid, name, position) '
+            'select new.id, new.name, position from positions where position_id = new.position_id; '
+            'end'
+        ]
+
+        self.schema_version = 8
+        self.migrations = [
+            self.migrate_iso_dates,
+            self.migrate_unique_employees,
+            self.migrate_revisions,
+            self.migrate_full_text_search,
+            self.migrate_positions,
+            self.migrate_search_delete_guard,
+            self.migrate_search_deletes,
+            self.migrate_revision_trigger
+        ]
+
+        self.init_state()
         self.init_db()
 
+    def init_state(self):
+        self.pool = ConnectionPool(
+            self.connect_db,
+            size=self.app_handler.config['DATABASE_POOL_SIZE'],
+            timeout=self.app_handler.config['DATABASE_POOL_TIMEOUT']
+        )
+
+        self.statement_cache = OrderedDict()
+        self.statement_cache_lock = Lock()
+
+        self.snapshot = EmployeeSnapshot() if self.filter_engine == 'numpy' else None
+        self.employee_cache = LRUCache(self.app_handler.config['EMPLOYEE_CACHE_SIZE'])
+        self.filter_cache = ResultCache(
+            self.app_handler.config['FILTER_CACHE_SIZE'],
+            self.app_handler.config['FILTER_CACHE_TTL']
+        )
+
+        self.seen_revision = None
+        self.own_revisions = set()
+        self.revision_lock = Lock()
+        # connection only reading data_version, it changes when any other connection commits
+        self.version_db = None
+        self.seen_data_version = None
+        self.version_lock = Lock()
+
+        self.profiler = None
+        if self.app_handler.config['SQL_PROFILER']:
+            self.profiler = StatementProfiler(
+                self.app_handler.config['SQL_SLOW_THRESHOLD'],
+                self.app_handler.config['SQL_SLOW_LOG_SIZE']
+            )
+
+    def reset_after_fork(self):
+        # SQLite connections must not be used across fork, locks may be held by threads of the parent
+        self.init_state()
+
+    def close_connections(self):
+        self.pool.close_all()
+        with self.version_lock:
+            if self.version_db is not None:
+                self.version_db.close()
+                self.version_db = None
+
     def connect_db(self):
-        rv = sqlite3.connect(self.app_handler.config['DATABASE'])
+        rv = sqlite3.connect(
+            self.app_handler.config['DATABASE'],
+            check_same_thread=False,
+            cached_statements=self.app_handler.config['SQLITE_CACHED_STATEMENTS']
+        )
         rv.row_factory = sqlite3.Row
+        for pragma in self.pragmas:
+            rv.execute('pragma ' + pragma + ' = ' + str(self.pragmas[pragma]))
         return rv
 
     def get_db(self):
         if not hasattr(g, 'sqlite_db'):
-            g.sqlite_db = self.connect_db()
+            g.sqlite_db = self.pool.acquire()
         return g.sqlite_db
 
     def init_db(self):
         with self.app_handler.app_context():
-            db_path = abspath(dirname( abspath(dirname(__file__)) )) + "/" +  self.database_name
-            if not exists(db_path):
-                db = self.get_db()
-                with self.app_handler.open_resource(
-                        abspath(dirname(__file__)) + '/schema.sql',
-                        mode='r'
-                ) as f:
-                    db.cursor().executescript(f.read())
-                db.commit()
+            # workers started at the same time create or migrate the database once
+            with self.transaction() as db:
+                if len(db.execute('select name from sqlite_master where name = \'employees\'').fetchall()) == 0:
+                    with self.app_handler.open_resource(
+                            abspath(dirname(__file__)) + '/schema.sql',
+                            mode='r'
+                    ) as f:
+                        self.execute_script(db, f.read())
+                    self.create_search_index(db)
+                else:
+                    self.migrate_db(db)
+            self.close_db()
+
+    def execute_script(self, db, script):
+        # executescript() commits, statements are run one by one to stay in the transaction
+        statement = ''
+        for line in script.splitlines(True):
+            statement += line
+            if sqlite3.complete_statement(statement):
+                db.execute(statement)
+                statement = ''
+
+    def migrate_db(self, db):
+        version = db.execute('pragma user_version').fetchone()[0]
+        for migration in self.migrations[version:self.schema_version]:
+            migration(db)
+            version += 1
+            db.execute('pragma user_version = ' + str(version))
+
+    def migrate_iso_dates(self, db):
+        db.execute('alter table employees add column birthdate_iso VARCHAR not null default \'\'')
+        db.execute('alter table employees add column enrollmentdate_iso VARCHAR not null default \'\'')
+        db.executemany(
+            'update employees set birthdate_iso = ?, enrollmentdate_iso = ? where id = ?',
+            [
+                (
+                    staff.convert_str_to_iso(r['birthdate']),
+                    staff.convert_str_to_iso(r['enrollmentdate']),
+                    r['id']
+                )
+                for r in db.execute('select id, birthdate, enrollmentdate from employees').fetchall()
+            ]
+        )
+        db.execute('create index employees_birthdate_iso on employees (birthdate_iso)')
+        db.execute('create index employees_enrollmentdate_iso on employees (enrollmentdate_iso)')
+
+    def migrate_unique_employees(self, db):
+        db.execute(
+            'delete from employees where id not in '
+            '(select min(id) from employees group by name, birthdate)'
+        )
+        db.execute('create unique index employees_name_birthdate on employees (name, birthdate)')
+
+    def migrate_revisions(self, db):
+        db.execute('create table revisions (name VARCHAR primary key, revision integer not null)')
+        db.execute('insert into revisions (name, revision) values (\'employees\', 0)')
+        db.execute('alter table employees add column revision integer not null default 0')
+
+    def migrate_full_text_search(self, db):
+        db.execute(
+            'create virtual table employees_fts using fts5('
+            'name, position, content=\'employees\', content_rowid=\'id\', '
+            'tokenize=\'unicode61 remove_diacritics 2\')'
+        )
+        # index of external content table is kept in sync by every write of employees
+        db.execute(
+            'create trigger employees_fts_insert after insert on employees begin '
+            'insert into employees_fts (rowid, name, position) values (new.id, new.name, new.position); '
+            'end'
+        )
+        db.execute(
+            'create trigger employees_fts_delete after delete on employees begin '
+            'insert into employees_fts (employees_fts, rowid, name, position) '
+            'values (\'delete\', old.id, old.name, old.position); '
+            'end'
+        )
+        db.execute(
+            'create trigger employees_fts_update after update of name, position on employees begin '
+            'insert into employees_fts (employees_fts, rowid, name, position) '
+            'values (\'delete\', old.id, old.name, old.position); '
+            'insert into employees_fts (rowid, name, position) values (new.id, new.name, new.position); '
+            'end'
+        )
+        db.execute('insert into employees_fts (employees_fts) values (\'rebuild\')')
+
+    def migrate_positions(self, db):
+        # SQLite can not change a column to foreign key, employees table is rebuilt with the same ids
+        db.execute('drop table employees_fts')
+        db.execute('create table positions (position_id integer primary key, position VARCHAR not null unique)')
+        db.execute('insert into positions (position) select distinct position from employees order by position')
+        db.execute(
+            'create table employees_positions ('
+            'id integer primary key autoincrement, '
+            'name VARCHAR not null, '
+            'birthdate VARCHAR not null, '
+            'position_id integer not null references positions (position_id), '
+            'enrollmentdate VARCHAR not null, '
+            'birthdate_iso VARCHAR not null, '
+            'enrollmentdate_iso VARCHAR not null, '
+            'revision integer not null default 0)'
+        )
+        db.execute(
+            'insert into employees_positions '
+            '(id, name, birthdate, position_id, enrollmentdate, birthdate_iso, enrollmentdate_iso, revision) '
+            'select id, name, birthdate, position_id, enrollmentdate, birthdate_iso, enrollmentdate_iso, revision '
+            'from employees join positions using (position)'
+        )
+
+        # ids of deleted employees are not reused, as before the migration
+        sequence = db.execute('select seq from sqlite_sequence where name = \'employees\'').fetchall()
+        db.execute('drop table employees')
+        db.execute('alter table employees_positions rename to employees')
+        db.execute('delete from sqlite_sequence where name = \'employees\'')
+        if len(sequence) > 0:
+            db.execute('insert into sqlite_sequence (name, seq) values (\'employees\', ?)', [sequence[0][0]])
+
+        db.execute('create unique index employees_name_birthdate on employees (name, birthdate)')
+        db.execute('create index employees_birthdate_iso on employees (birthdate_iso)')
+        db.execute('create index employees_enrollmentdate_iso on employees (enrollmentdate_iso)')
+        db.execute('create index employees_position_id on employees (position_id)')
+
+        self.create_search_index(db)
+        db.execute(
+            'create trigger employees_fts_delete after delete on employees begin '
+            'insert into employees_fts (employees_fts, rowid, name, position) '
+            'select \'delete\', old.id, old.name, position from positions where position_id = old.position_id; '
+            'end'
+        )
+
+    def migrate_search_delete_guard(self, db):
+        # rows already removed from full-text index by delete-all are skipped
+        db.execute('drop trigger employees_fts_delete')
+        db.execute(
+            'create trigger employees_fts_delete after delete on employees '
+            'when exists (select 1 from employees_fts_docsize where id = old.id) begin '
+            'insert into employees_fts (employees_fts, rowid, name, position) '
+            'select \'delete\', old.id, old.name, position from positions where position_id = old.position_id; '
+            'end'
+        )
+
+    def migrate_search_deletes(self, db):
+        # any delete trigger keeps SQLite from truncating employees in delete_all
+        db.execute('drop trigger employees_fts_delete')
+
+    def migrate_revision_trigger(self, db):
+        # employee inserted with a newer revision moves the shared one, batches of one revision move it once
+        db.execute(
+            'create trigger employees_revision after insert on employees begin '
+            'update revisions set revision = new.revision where name = \'employees\' and revision < new.revision; '
+            'end'
+        )
+
+    def create_search_index(self, db):
+        for statement in self.search_schema:
+            db.execute(statement)
+        db.execute('insert into employees_fts (employees_fts) values (\'rebuild\')')
 
     def close_db(self):
         if hasattr(g, 'sqlite_db'):
-            g.sqlite_db.close()
+            self.pool.release(g.pop('sqlite_db'))
+
+    def make_employee_row(self, employee_info, position_id, revision):
+        return [
+            employee_info['name'],
+            employee_info['birthdate'],
+            position_id,
+            employee_info['enrollmentdate'],
+            staff.convert_str_to_iso(employee_info['birthdate']),
+            staff.convert_str_to_iso(employee_info['enrollmentdate']),
+            revision
+        ]
+
+    def make_employee_record(self, employee_info, id):
+        record = {'id': id}
+        for key in self.employee_keys:
+            record[key] = employee_info[key]
+        return record
 
     def insert_employee(self, employee_info):
-        if len(
-            self.execute_query(
-                'select id from employees where name = \'' + \
-                employee_info['name'] + \
-                "\' and birthdate = \'" + \
-                employee_info['birthdate'] + \
-                '\'',
-                commit=False
-            )
-        ) == 0:
-
-            self.execute_query(
-                'insert into employees (name, birthdate, position, enrollmentdate) values (?, ?, ?, ?)',
-                vars=[
-                     employee_info['name'],
-                     employee_info['birthdate'],
-                     employee_info['position'],
-                     employee_info['enrollmentdate']
+        try:
+            with self.transaction() as db:
+                self.execute(db, 'insert or ignore into positions (position) values (?)', [employee_info['position']])
+                params = [
+                    employee_info['name'],
+                    employee_info['birthdate'],
+                    employee_info['enrollmentdate'],
+                    staff.convert_str_to_iso(employee_info['birthdate']),
+                    staff.convert_str_to_iso(employee_info['enrollmentdate']),
+                    employee_info['position']
                 ]
-            )
-
-            return True, self.execute_query(
-                'select id from employees where name = \'' + \
-                employee_info['name'] + \
-                "\' and birthdate = \'" + \
-                employee_info['birthdate'] + \
-                '\'',
-                commit=False
-            )
-
-        else:
+                if self.is_returning_supported:
+                    id, revision = self.fetch_all(
+                        db,
+                        self.insert_employee_select_query + ' returning id, revision',
+                        params
+                    )[0]
+                else:
+                    id = self.execute(db, self.insert_employee_select_query, params).lastrowid
+                    revision = self.fetch_all(db, 'select revision from revisions where name = \'employees\'')[0][0]
+        except sqlite3.IntegrityError:
             return False, []
 
-    def delete_all(self):
-        self.execute_query('delete from employees')
+        self.record_revision(revision)
+        self.employee_cache.invalidate([id])
+        if self.snapshot is not None:
+            self.snapshot.add([self.make_employee_record(employee_info, id)])
+
+        return True, [{'id': id}]
+
+    def insert_employees(self, employees_info):
+        inserted_keys = set()
+        inserted_employees = []
+        ids = []
+
+        with self.transaction() as db:
+            for employee_info in employees_info:
+                key = (employee_info['name'], employee_info['birthdate'])
+                if key in inserted_keys or len(
+                    self.fetch_all(db, 'select id from employees where name = ? and birthdate = ?', key)
+                ) != 0:
+                    ids.append(None)
+                else:
+                    inserted_keys.add(key)
+                    inserted_employees.append(employee_info)
+                    ids.append(0)
+
+            revision = None
+            if len(inserted_employees) > 0:
+                revision = self.bump_revision(db)
+                position_ids = self.get_position_ids(db, [e['position'] for e in inserted_employees])
+                self.execute_many(
+                    db,
+                    self.insert_employee_query,
+                    [self.make_employee_row(e, position_ids[e['position']], revision) for e in inserted_employees]
+                )
+            last_id = self.fetch_all(db, 'select last_insert_rowid()')[0][0]
+
+        # the write lock is held for the whole batch, so autoincrement ids are consecutive
+        next_id = last_id - len(inserted_employees) + 1
+        for index in range(len(ids)):
+            if ids[index] is not None:
+                ids[index] = next_id
+                next_id += 1
+
+        self.record_revision(revision)
+        self.employee_cache.invalidate([id for id in ids if id is not None])
+        if self.snapshot is not None:
+            self.snapshot.add([
+                self.make_employee_record(employees_info[index], ids[index])
+                for index in range(len(ids)) if ids[index] is not None
+            ])
+
+        return ids
+
+    def select_position_id(self, db, position):
+        rows = self.fetch_all(db, 'select position_id from positions where position = ?', [position])
+        return rows[0][0] if len(rows) > 0 else None
+
+    def get_position_ids(self, db, positions):
+        # positions are never deleted, so their ids stay valid for every process
+        position_ids = {}
+        for position in set(positions):
+            position_id = self.select_position_id(db, position)
+            if position_id is None:
+                position_id = self.execute(db, 'insert into positions (position) values (?)', [position]).lastrowid
+            position_ids[position] = position_id
+        return position_ids
+
+    def resolve_positions(self, db, filters_list):
+        # position filters compare ids, unknown position has id 0 that no employee refers to
+        resolved_filters = []
+        for filt in filters_list:
+            if filt['key'] == 'position':
+                filt = dict(filt, position_id=self.select_position_id(db, filt['value']) or 0)
+            resolved_filters.append(filt)
+        return resolved_filters
 
-    def select_all(self):
+    def delete_all(self):
+        with self.transaction() as db:
+            # ids are never reused, all employees inserted later have bigger ones
+            last_id = self.fetch_all(db, 'select max(id) from employees')[0][0]
+            # without a delete trigger SQLite truncates the table, full-text index is emptied at once
+            self.execute(db, 'insert into employees_fts (employees_fts) values (\'delete-all\')')
+            self.execute(db, 'delete from employees')
+            revision = self.bump_revision(db)
+
+        self.record_revision(revision)
+        self.employee_cache.clear()
+        if self.snapshot is not None:
+            self.snapshot.clear(last_id)
+
+    def bump_revision(self, db):
+        # persisted in the writing transaction, so it is shared by all processes using the database
+        self.execute(db, 'update revisions set revision = revision + 1 where name = \'employees\'')
+        return self.fetch_all(db, 'select revision from revisions where name = \'employees\'')[0][0]
+
+    def select_revision(self):
         return self.execute_query(
-            'select * from employees order by id',
+            'select revision from revisions where name = \'employees\'',
             commit=False
-        )
+        )[0]['revision']
+
+    def record_revision(self, revision):
+        if revision is not None:
+            with self.revision_lock:
+                self.own_revisions.add(revision)
+
+    def select_data_version(self):
+        with self.version_lock:
+            if self.version_db is None:
+                self.version_db = self.connect_db()
+            return self.version_db.execute('pragma data_version').fetchone()[0]
+
+    def sync_revision(self):
+        # nothing was committed since the last check, revision is the same
+        data_version = self.select_data_version()
+        with self.revision_lock:
+            if data_version == self.seen_data_version:
+                return self.seen_revision
+
+        # revisions written by other processes invalidate everything cached by this one
+        revision = self.select_revision()
+
+        with self.revision_lock:
+            self.seen_data_version = data_version
+            if revision == self.seen_revision:
+                return revision
+
+            is_foreign = self.seen_revision is None or revision < self.seen_revision or \
+                revision - self.seen_revision != len(
+                    [r for r in self.own_revisions if self.seen_revision < r <= revision]
+                )
+            self.own_revisions = set(r for r in self.own_revisions if r > revision)
+            self.seen_revision = revision
+
+        if is_foreign:
+            self.employee_cache.clear()
+            self.filter_cache.clear()
+            if self.snapshot is not None:
+                self.snapshot.unload()
+
+        return revision
+
+    def select_all(self, limit=None, after_id=None):
+        return self.select_with_filtration([], limit=limit, after_id=after_id)
 
     def select_employee_by_id(self, id):
-        employee = self.execute_query(
-            'select * from employees where id = \'' + str(id) + '\'',
-            commit=False
-        )
+        is_exist, employee, revision = self.select_employee_with_revision(id)
+        return is_exist, employee
 
+    def select_employee_with_revision(self, id):
+        # revision of the row is cached with it, ETag of a cached employee needs no query
+        self.sync_revision()
+        is_cached, entry = self.employee_cache.get(id)
+
+        if not is_cached:
+            version = self.employee_cache.get_version()
+            employee = self.execute_query(
+                'select ' + self.employee_columns + ', revision from ' + self.employees_source + ' where id = ?',
+                vars=[id],
+                commit=False
+            )
+            revisions = [e.pop('revision') for e in employee]
+            entry = (employee, revisions[0] if len(revisions) == 1 else None)
+            self.employee_cache.put(id, entry, version)
+
+        employee, revision = entry
         if len(employee) == 1:
-            return True, employee
+            return True, employee, revision
         else:
-            return False, []
+            return False, [], None
 
     def delete_employees(self, filters_list):
-        employees_to_delete = self.select_with_filtration(filters_list)
+        with self.transaction() as db:
+            filters_list = self.resolve_positions(db, filters_list)
+            self.execute(db, *self.get_filtration_statement('unindex', filters_list))
+            if self.is_returning_supported:
+                rows = self.fetch_all(db, *self.get_filtration_statement('delete_returning', filters_list))
+            else:
+                rows = self.fetch_all(db, *self.get_filtration_statement('capture', filters_list))
+                self.execute(db, *self.get_filtration_statement('delete', filters_list))
 
-        if len(employees_to_delete) > 0:
-            query = 'delete from employees where '
+            revision = None
+            if len(rows) > 0:
+                revision = self.bump_revision(db)
 
-            ids = []
-            for employee in employees_to_delete:
-                ids.append('id = \'' + str(employee['id']) + '\'')
+        deleted_employees = sorted([self.process_row(r) for r in rows], key=lambda e: e['id'])
 
-            self.execute_query(query + ' or '.join(ids))
-            return True, employees_to_delete
+        self.record_revision(revision)
+        self.employee_cache.invalidate([e['id'] for e in deleted_employees])
+        if self.snapshot is not None:
+            self.snapshot.remove([e['id'] for e in deleted_employees])
 
-        else:
-            return False, []
+        return len(deleted_employees) > 0, deleted_employees
 
     def delete_employee_by_id(self, id):
-        is_exist, employee = self.select_employee_by_id(id)
-
-        if is_exist:
-            query = 'delete from employees where id = \'' + str(id) + '\''
-            self.execute_query(query)
-
-        return is_exist, employee
+        with self.transaction() as db:
+            self.execute(
+                db,
+                'insert into employees_fts (employees_fts, rowid, name, position) '
+                'select \'delete\', id, name, position from ' + self.employees_source + ' where id = ?',
+                [id]
+            )
+            if self.is_returning_supported:
+                rows = self.fetch_all(
+                    db,
+                    'delete from employees where id = ? returning ' + self.returning_columns,
+                    [id]
+                )
+            else:
+                rows = self.fetch_all(
+                    db,
+                    'select ' + self.employee_columns + ' from ' + self.employees_source + ' where id = ?',
+                    [id]
+                )
+                self.execute(db, 'delete from employees where id = ?', [id])
+
+            revision = None
+            if len(rows) > 0:
+                revision = self.bump_revision(db)
+
+        employee = [self.process_row(r) for r in rows]
+
+        self.record_revision(revision)
+        self.employee_cache.invalidate([id])
+        if self.snapshot is not None:
+            self.snapshot.remove([e['id'] for e in employee])
+
+        return len(employee) == 1, employee
 
     def process_row(self, row):
         row = dict(row)
         return row
 
-    def select_with_filtration(self, filters_list=[]):
-        db = self.get_db()
-        query = 'select * from employees '
-        query_end = ' order by id'
+    def make_filter_condition(self, key, expr):
+        if key == 'position':
+            return 'position_id ' + expr + ' ?'
+
+        column = staff.filter_iso_columns[key]
+        if expr in ['>=', '>']:
+            return column + ' <= ?'
+        elif expr in ['<', '<=']:
+            return column + ' > ?'
+        elif expr == '=':
+            return '(' + column + ' <= ? and ' + column + ' > ?)'
+        elif expr == '!=':
+            return '(' + column + ' > ? or ' + column + ' <= ?)'
+
+    def make_filter_params(self, filt):
+        if filt['key'] == 'position':
+            return [filt['position_id']]
+
+        years = int(filt['value'])
+        if filt['expr'] in ['>=', '<']:
+            return [staff.calculate_years_boundary(years)]
+        elif filt['expr'] in ['>', '<=']:
+            return [staff.calculate_years_boundary(years + 1)]
+        else:
+            return [staff.calculate_years_boundary(years), staff.calculate_years_boundary(years + 1)]
+
+    def make_filtration_statement(self, shape):
+        template, has_after, has_limit, filters_shape = shape
+
+        conditions = []
+        if has_after:
+            # search results are ordered by rank, then id
+            conditions.append('(match_rank > ? or (match_rank = ? and id > ?))' if template == 'search' else 'id > ?')
+        for key, expr in filters_shape:
+            conditions.append(self.make_filter_condition(key, expr))
+
+        return self.statement_templates[template].format(
+            where='where ' + ' and '.join(conditions) if len(conditions) > 0 else '',
+            limit='limit ?' if has_limit else ''
+        )
+
+    def get_filtration_statement(self, template, filters_list, after_id=None, limit=None):
+        # statements are cached by filters shape (keys and expressions), values are always bound
+        filters_list = sorted(filters_list, key=lambda f: (f['key'], f['expr']))
+        shape = (
+            template,
+            after_id is not None,
+            limit is not None,
+            tuple((f['key'], f['expr']) for f in filters_list)
+        )
 
+        with self.statement_cache_lock:
+            query = self.statement_cache.get(shape)
+            if query is not None:
+                self.statement_cache.move_to_end(shape)
+
+        if query is None:
+            query = self.make_filtration_statement(shape)
+            with self.statement_cache_lock:
+                self.statement_cache[shape] = query
+                if len(self.statement_cache) > self.statement_cache_size:
+                    self.statement_cache.popitem(last=False)
+
+        params = []
+        if after_id is not None:
+            params.extend([after_id[0], after_id[0], after_id[1]] if template == 'search' else [after_id])
         for filt in filters_list:
-            if filt['key'] == 'position':
-                query += 'where position ' + filt['expr'] + ' \'' + filt['value'] + '\''
-                break
+            params.extend(self.make_filter_params(filt))
+        if limit is not None:
+            params.append(limit)
+
+        return query, params
+
+    def select_with_filtration(self, filters_list=[], limit=None, after_id=None):
+        if len(filters_list) == 0:
+            return self.select_filtered_rows(filters_list, limit, after_id)
 
-        cur = db.execute(query + query_end)
+        key = (staff.canonicalize_filters(filters_list), limit, after_id)
+        generation = self.sync_revision()
 
-        filtered_employees = []
-        for employee in [self.process_row(r) for r in cur.fetchall()]:
+        is_cached, employees = self.filter_cache.get(key, generation)
+        if not is_cached:
+            expires_at = self.filter_cache.get_expiration_time()
+            employees = self.select_filtered_rows(filters_list, limit, after_id)
+            if len(employees) <= self.filter_cache_max_rows:
+                self.filter_cache.put(key, employees, generation, expires_at)
 
-            filtration_results = []
-            for filt in filters_list:
-                if filt['key'] in ['age', 'experience']:
-                    if staff.is_correct_comparison(
-                            employee[staff.filter_columns[filt['key']]], filt['expr'], filt['value']
-                    ):
-                        filtration_results.append(True)
-                    else:
-                        filtration_results.append(False)
-                        break
+        return employees
 
-            if filtration_results.count(False) == 0:
-                filtered_employees.append(employee)
+    def select_filtered_rows(self, filters_list, limit, after_id):
+        if self.filter_engine != 'sql' and len(filters_list) > 0:
+            return list(self.iterate_with_filtration(filters_list, limit, after_id))
 
-        return filtered_employees
+        filters_list = self.resolve_positions(self.get_db(), filters_list)
+        query, params = self.get_filtration_statement('select', filters_list, after_id, limit)
+
+        return self.execute_query(
+            query,
+            vars=params,
+            commit=False
+        )
+
+    def search_employees(self, search_query, filters_list=[], limit=None, after=None):
+        # after is (rank, id) of the last employee of previous page
+        filters_list = self.resolve_positions(self.get_db(), filters_list)
+        query, params = self.get_filtration_statement('search', filters_list, after, limit)
+
+        return self.execute_query(
+            query,
+            vars=[search_query] + params,
+            commit=False
+        )
+
+    def iterate_with_filtration(self, filters_list=[], limit=None, after_id=None):
+        if self.filter_engine == 'python' and len(filters_list) > 0:
+            predicate = staff.compile_filters(filters_list)
+            employees = filter(
+                predicate,
+                self.iterate_rows(*self.get_filtration_statement('select', [], after_id))
+            )
+            return islice(employees, limit)
+
+        if self.filter_engine == 'numpy' and len(filters_list) > 0:
+            return iter(self.get_snapshot().select(filters_list, limit, after_id))
+
+        filters_list = self.resolve_positions(self.get_db(), filters_list)
+        return self.iterate_rows(*self.get_filtration_statement('select', filters_list, after_id, limit))
+
+    def get_snapshot(self):
+        self.sync_revision()
+        if not self.snapshot.is_loaded:
+            self.snapshot.load(self.iterate_rows(*self.get_filtration_statement('select', [])))
+        return self.snapshot
+
+    def iterate_rows(self, query, params):
+        db = self.get_db()
+        seconds = 0.0
+        count = 0
+        try:
+            started = perf_counter()
+            cur = db.execute(query, params)
+
+            rows = cur.fetchmany(self.fetch_size)
+            while True:
+                elapsed = perf_counter() - started
+                seconds += elapsed
+                count += len(rows)
+                self.record_query(elapsed, len(rows))
+                if not rows:
+                    break
+
+                for r in rows:
+                    yield self.process_row(r)
+                started = perf_counter()
+                rows = cur.fetchmany(self.fetch_size)
+        finally:
+            # also for iteration stopped by a limit, rows fetched so far are profiled
+            if self.profiler is not None:
+                self.profiler.record(db, query, params, seconds, count)
+
+    def execute(self, db, query, params=()):
+        # statements of requests are run by execute and fetch_all, so all of them are measured
+        started = perf_counter()
+        cur = db.execute(query, params)
+        self.record_query(perf_counter() - started, 0, db, query, params)
+        return cur
+
+    def execute_many(self, db, query, params_list):
+        started = perf_counter()
+        cur = db.executemany(query, params_list)
+        self.record_query(perf_counter() - started, 0, db, query)
+        return cur
+
+    def fetch_all(self, db, query, params=()):
+        started = perf_counter()
+        rows = db.execute(query, params).fetchall()
+        self.record_query(perf_counter() - started, len(rows), db, query, params)
+        return rows
+
+    def record_query(self, seconds, rows=0, db=None, query=None, params=None):
+        # SQLite time and fetched rows are added to metrics of current request
+        if has_app_context():
+            stats = g.get('request_stats')
+            if stats is not None:
+                stats.sqlite_seconds += seconds
+                stats.rows_fetched += rows
+
+        if self.profiler is not None and query is not None:
+            self.profiler.record(db, query, params, seconds, rows)
+
+    @contextmanager
+    def transaction(self):
+        db = self.get_db()
+        self.execute(db, 'begin immediate')
+        started = perf_counter()
+        try:
+            yield db
+        except BaseException:
+            db.rollback()
+            self.record_query(perf_counter() - started)
+            raise
+        db.commit()
+        self.record_query(perf_counter() - started)
 
     def execute_query(self, query, vars=None, commit=True):
         db = self.get_db()
-        if vars:
-            cur = db.execute(query, vars)
-        else:
-            cur = db.execute(query)
+        started = perf_counter()
+        try:
+            if vars:
+                cur = db.execute(query, vars)
+            else:
+                cur = db.execute(query)
+        except sqlite3.Error:
+            if commit:
+                db.rollback()
+            self.record_query(perf_counter() - started)
+            raise
         if commit:
             db.commit()
+            self.record_query(perf_counter() - started, 0, db, query, vars)
+            return cur
         else:
-            return [self.process_row(r) for r in cur.fetchall()]
+            rows = cur.fetchall()
+            self.record_query(perf_counter() - started, len(rows), db, query, vars)
+            return [self.process_row(r) for r in rows]
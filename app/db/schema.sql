@@ -1,8 +1,32 @@
+drop view if exists employees_content;
+drop table if exists employees_fts;
 drop table if exists employees;
+drop table if exists positions;
+drop table if exists revisions;
+create table positions (
+  position_id integer primary key,
+  position VARCHAR not null unique
+);
 create table employees (
   id integer primary key autoincrement,
   name VARCHAR not null,
   birthdate VARCHAR not null,
-  position VARCHAR not null,
-  enrollmentdate VARCHAR not null
-);
\ No newline at end of file
+  position_id integer not null references positions (position_id),
+  enrollmentdate VARCHAR not null,
+  birthdate_iso VARCHAR not null,
+  enrollmentdate_iso VARCHAR not null,
+  revision integer not null default 0
+);
+create unique index employees_name_birthdate on employees (name, birthdate);
+create index employees_birthdate_iso on employees (birthdate_iso);
+create index employees_enrollmentdate_iso on employees (enrollmentdate_iso);
+create index employees_position_id on employees (position_id);
+create table revisions (
+  name VARCHAR primary key,
+  revision integer not null
+);
+insert into revisions (name, revision) values ('employees', 0);
+create trigger employees_revision after insert on employees begin
+  update revisions set revision = new.revision where name = 'employees' and revision < new.revision;
+end;
+pragma user_version = 8;
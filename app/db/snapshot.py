@@ -0,0 +1,183 @@
+from datetime import date
+from threading import Lock
+import staff
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def make_date_key(s):
+    year, month, day = staff.convert_str_to_date_key(s)
+    return year * 10000 + month * 100 + day
+
+
+class EmployeeSnapshot(object):
+
+    def __init__(self):
+        if numpy is None:
+            raise RuntimeError('NumPy is required for \'numpy\' filter engine')
+
+        self.lock = Lock()
+        self.is_loaded = False
+        # ids up to it were deleted by delete_all, insertions reported after that are dropped
+        self.deleted_up_to = 0
+        self.clear_arrays()
+
+    def clear_arrays(self):
+        self.ids = numpy.empty(0, dtype=numpy.int64)
+        self.birthdates = numpy.empty(0, dtype=numpy.int32)
+        self.enrollmentdates = numpy.empty(0, dtype=numpy.int32)
+        self.positions = numpy.empty(0, dtype=numpy.int32)
+        self.alive = numpy.empty(0, dtype=bool)
+        self.rows = numpy.empty(0, dtype=object)
+        self.position_codes = {}
+        self.pending = []
+        self.removed = set()
+        self.dead = 0
+
+    def load(self, employees):
+        with self.lock:
+            if self.is_loaded:
+                return
+            self.clear_arrays()
+            self.pending = list(employees)
+            self.flush()
+            self.is_loaded = True
+
+    def add(self, employees):
+        with self.lock:
+            if self.is_loaded:
+                self.pending.extend(employees)
+
+    def remove(self, ids):
+        with self.lock:
+            if not self.is_loaded or len(ids) == 0:
+                return
+            self.flush()
+
+            ids = numpy.asarray(ids, dtype=numpy.int64)
+            indexes = numpy.searchsorted(self.ids, ids)
+            found = indexes < len(self.ids)
+            found[found] = self.ids[indexes[found]] == ids[found]
+            indexes = indexes[found]
+
+            self.dead += int(numpy.count_nonzero(self.alive[indexes]))
+            self.alive[indexes] = False
+
+            # rows deleted after commit of their insertion but before it is reported
+            if len(indexes) < len(ids):
+                self.removed.update(int(id) for id in ids[~found])
+
+            if self.dead * 2 > len(self.ids):
+                self.compact(self.alive)
+
+    def clear(self, last_id):
+        with self.lock:
+            self.clear_arrays()
+            if last_id is not None:
+                self.deleted_up_to = max(self.deleted_up_to, last_id)
+
+    def unload(self):
+        with self.lock:
+            self.clear_arrays()
+            self.is_loaded = False
+
+    def get_position_code(self, position):
+        if position not in self.position_codes:
+            self.position_codes[position] = len(self.position_codes)
+        return self.position_codes[position]
+
+    def flush(self):
+        if len(self.pending) == 0:
+            return
+
+        employees, self.pending = self.pending, []
+        if len(self.removed) > 0:
+            removed = self.removed
+            self.removed = removed.difference(e['id'] for e in employees)
+            employees = [e for e in employees if e['id'] not in removed]
+        employees = [e for e in employees if e['id'] > self.deleted_up_to]
+        self.ids = numpy.concatenate([
+            self.ids,
+            numpy.fromiter((e['id'] for e in employees), dtype=numpy.int64, count=len(employees))
+        ])
+        self.birthdates = numpy.concatenate([
+            self.birthdates,
+            numpy.fromiter((make_date_key(e['birthdate']) for e in employees), dtype=numpy.int32, count=len(employees))
+        ])
+        self.enrollmentdates = numpy.concatenate([
+            self.enrollmentdates,
+            numpy.fromiter((make_date_key(e['enrollmentdate']) for e in employees), dtype=numpy.int32, count=len(employees))
+        ])
+        self.positions = numpy.concatenate([
+            self.positions,
+            numpy.fromiter((self.get_position_code(e['position']) for e in employees), dtype=numpy.int32, count=len(employees))
+        ])
+        self.alive = numpy.concatenate([self.alive, numpy.ones(len(employees), dtype=bool)])
+        rows = numpy.empty(len(employees), dtype=object)
+        rows[:] = employees
+        self.rows = numpy.concatenate([self.rows, rows])
+
+        # concurrent inserts may be reported out of id order, or twice around the initial load
+        if len(self.ids) > 1 and not numpy.all(self.ids[1:] > self.ids[:-1]):
+            order = numpy.argsort(self.ids, kind='stable')
+            self.reorder(order)
+            unique = numpy.ones(len(self.ids), dtype=bool)
+            unique[1:] = self.ids[1:] != self.ids[:-1]
+            self.compact(unique)
+
+    def reorder(self, order):
+        self.ids = self.ids[order]
+        self.birthdates = self.birthdates[order]
+        self.enrollmentdates = self.enrollmentdates[order]
+        self.positions = self.positions[order]
+        self.alive = self.alive[order]
+        self.rows = self.rows[order]
+
+    def compact(self, mask):
+        self.reorder(mask)
+        self.dead = int(numpy.count_nonzero(~self.alive))
+
+    def make_filter_mask(self, filt, today):
+        if filt['key'] == 'position':
+            code = self.position_codes.get(filt['value'], -1)
+            if filt['expr'] == '=':
+                return self.positions == code
+            return self.positions != code
+
+        column = self.birthdates if filt['key'] == 'age' else self.enrollmentdates
+
+        # calculate_years(d) >= years  <=>  date key of d <= boundary
+        years = min(int(filt['value']), today.year)
+        boundary = (today.year - years) * 10000 + today.month * 100 + today.day
+        next_boundary = boundary - 10000
+
+        if filt['expr'] == '>=':
+            return column <= boundary
+        elif filt['expr'] == '>':
+            return column <= next_boundary
+        elif filt['expr'] == '<':
+            return column > boundary
+        elif filt['expr'] == '<=':
+            return column > next_boundary
+        elif filt['expr'] == '=':
+            return (column <= boundary) & (column > next_boundary)
+        else:
+            return (column > boundary) | (column <= next_boundary)
+
+    def select(self, filters_list, limit=None, after_id=None):
+        today = date.today()
+
+        with self.lock:
+            self.flush()
+
+            mask = self.alive.copy()
+            if after_id is not None:
+                mask &= self.ids > after_id
+            for filt in filters_list:
+                mask &= self.make_filter_mask(filt, today)
+
+            indexes = numpy.flatnonzero(mask)[:limit]
+            return list(self.rows[indexes])
@@ -0,0 +1,186 @@
+from bisect import bisect_left
+from collections import Counter
+from threading import Lock
+from time import perf_counter
+
+duration_buckets = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram(object):
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # last count is of values above all buckets (+Inf)
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ['+Inf'], self.counts):
+            cumulative += count
+            lines.append(
+                name + '_bucket' + format_labels(labels + [('le', format_value(bound))]) + ' ' + str(cumulative)
+            )
+        lines.append(name + '_sum' + format_labels(labels) + ' ' + format_value(self.sum))
+        lines.append(name + '_count' + format_labels(labels) + ' ' + str(self.count))
+        return lines
+
+
+class RequestStats(object):
+    # collected during one request, by request hooks and Queries
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.endpoint = None
+        self.status = 500
+        self.sqlite_seconds = 0.0
+        self.rows_fetched = 0
+        self.rows_returned = 0
+        self.is_streamed = False
+
+
+class Metrics(object):
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # also called in forked workers, each of them exposes its own metrics
+        self.lock = Lock()
+        self.in_flight = 0
+        self.requests = Counter()
+        self.durations = {}
+        self.sqlite_durations = {}
+        self.rows_fetched = Counter()
+        self.rows_returned = Counter()
+
+    def start_request(self):
+        with self.lock:
+            self.in_flight += 1
+        return RequestStats()
+
+    def finish_request(self, stats, method):
+        seconds = perf_counter() - stats.started
+        route = (stats.endpoint or 'none', method)
+
+        with self.lock:
+            self.in_flight -= 1
+            self.requests[route + (str(stats.status),)] += 1
+            if route not in self.durations:
+                self.durations[route] = Histogram(duration_buckets)
+                self.sqlite_durations[route] = Histogram(duration_buckets)
+            self.durations[route].observe(seconds)
+            self.sqlite_durations[route].observe(stats.sqlite_seconds)
+            self.rows_fetched[route] += stats.rows_fetched
+            self.rows_returned[route] += stats.rows_returned
+
+    def render(self, queries):
+        with self.lock:
+            in_flight = self.in_flight
+            requests = dict(self.requests)
+            # histograms are copied, they are changed under the lock
+            durations = [
+                (route, copy_histogram(self.durations[route]), copy_histogram(self.sqlite_durations[route]))
+                for route in self.durations
+            ]
+            rows_fetched = dict(self.rows_fetched)
+            rows_returned = dict(self.rows_returned)
+
+        lines = []
+        add_family(lines, 'rest_app_requests_in_flight', 'gauge', 'Requests being processed.')
+        lines.append('rest_app_requests_in_flight ' + str(in_flight))
+
+        add_family(lines, 'rest_app_requests_total', 'counter', 'Requests by route, method and status code.')
+        for (endpoint, method, status) in sorted(requests):
+            lines.append(
+                'rest_app_requests_total' +
+                format_labels([('route', endpoint), ('method', method), ('status', status)]) +
+                ' ' + str(requests[(endpoint, method, status)])
+            )
+
+        add_family(lines, 'rest_app_request_duration_seconds', 'histogram', 'Request latency by route.')
+        for route, duration, sqlite_duration in sorted(durations, key=lambda d: d[0]):
+            lines.extend(duration.render('rest_app_request_duration_seconds', route_labels(route)))
+
+        add_family(lines, 'rest_app_sqlite_duration_seconds', 'histogram', 'SQLite time per request by route.')
+        for route, duration, sqlite_duration in sorted(durations, key=lambda d: d[0]):
+            lines.extend(sqlite_duration.render('rest_app_sqlite_duration_seconds', route_labels(route)))
+
+        add_family(lines, 'rest_app_rows_fetched_total', 'counter', 'Rows fetched from SQLite by route.')
+        for route in sorted(rows_fetched):
+            lines.append('rest_app_rows_fetched_total' + format_labels(route_labels(route)) + ' ' + str(rows_fetched[route]))
+
+        add_family(lines, 'rest_app_rows_returned_total', 'counter', 'Employees returned in responses by route.')
+        for route in sorted(rows_returned):
+            lines.append('rest_app_rows_returned_total' + format_labels(route_labels(route)) + ' ' + str(rows_returned[route]))
+
+        lines.extend(render_queries(queries))
+        return '\n'.join(lines) + '\n'
+
+
+def copy_histogram(histogram):
+    copy = Histogram(histogram.buckets)
+    copy.counts = list(histogram.counts)
+    copy.sum = histogram.sum
+    copy.count = histogram.count
+    return copy
+
+
+def render_queries(queries):
+    caches = [('employee', queries.employee_cache.stats()), ('filter', queries.filter_cache.stats())]
+    lines = []
+
+    for name, kind, help_text in [
+        ('hits', 'counter', 'Cache hits.'),
+        ('misses', 'counter', 'Cache misses.'),
+        ('evictions', 'counter', 'Entries evicted from full cache.'),
+        ('size', 'gauge', 'Entries in cache.'),
+        ('capacity', 'gauge', 'Maximum entries in cache.')
+    ]:
+        metric = 'rest_app_cache_' + name + ('_total' if kind == 'counter' else '')
+        add_family(lines, metric, kind, help_text)
+        for cache, stats in caches:
+            lines.append(metric + format_labels([('cache', cache)]) + ' ' + str(stats[name]))
+
+    add_family(lines, 'rest_app_cache_expirations_total', 'counter', 'Stale entries dropped from cache.')
+    for cache, stats in caches:
+        if 'expirations' in stats:
+            lines.append('rest_app_cache_expirations_total' + format_labels([('cache', cache)]) + ' ' + str(stats['expirations']))
+
+    add_family(lines, 'rest_app_statement_cache_size', 'gauge', 'Filter statements in cache.')
+    lines.append('rest_app_statement_cache_size ' + str(len(queries.statement_cache)))
+
+    add_family(lines, 'rest_app_database_connections', 'gauge', 'Pooled SQLite connections.')
+    lines.append('rest_app_database_connections' + format_labels([('state', 'open')]) + ' ' + str(queries.pool.opened))
+    lines.append('rest_app_database_connections' + format_labels([('state', 'idle')]) + ' ' + str(len(queries.pool.idle)))
+    return lines
+
+
+def add_family(lines, name, kind, help_text):
+    lines.append('# HELP ' + name + ' ' + help_text)
+    lines.append('# TYPE ' + name + ' ' + kind)
+
+
+def route_labels(route):
+    return [('route', route[0]), ('method', route[1])]
+
+
+def format_labels(labels):
+    return '{' + ','.join(
+        name + '="' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for name, value in labels
+    ) + '}'
+
+
+def format_value(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value))
@@ -0,0 +1,125 @@
+from collections import Counter, defaultdict
+from os import listdir, makedirs, remove, getpid
+from os.path import join, getmtime
+from threading import Lock
+from time import time
+import cProfile
+import pstats
+import random
+import re
+
+profile_formats = ['pstats', 'collapsed']
+max_stack_depth = 64
+unsafe_chars = re.compile(r'[^A-Za-z0-9_.-]')
+# names of saved profiles, other files of the directory are never pruned
+profile_name = re.compile(r'^\d+-\d+-[A-Za-z0-9_.-]*-\d+\.\dms\.(prof|collapsed)$')
+
+
+def make_label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return name + ' (' + filename + ':' + str(line) + ')'
+
+
+def collapse_stats(stats):
+    # approximate stacks for flame graphs, time of a function is split between callers as cProfile measured it
+    callees = defaultdict(dict)
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees[caller][func] = edge
+
+    stacks = Counter()
+
+    def walk(func, stack, share):
+        cc, nc, tt, ct, callers = stats[func]
+        stack = stack + [make_label(func)]
+        stacks[';'.join(stack)] += tt * share
+
+        if len(stack) >= max_stack_depth:
+            return
+        for callee, edge in callees[func].items():
+            callee_ct = stats[callee][3]
+            if callee_ct > 0 and make_label(callee) not in stack:
+                walk(callee, stack, edge[3] * share / callee_ct)
+
+    for func in stats:
+        if len(stats[func][4]) == 0:
+            walk(func, [], 1.0)
+
+    # microseconds as sample counts of collapsed stack format
+    return ''.join(
+        stack + ' ' + str(int(seconds * 1000000)) + '\n'
+        for stack, seconds in sorted(stacks.items()) if int(seconds * 1000000) > 0
+    )
+
+
+class RequestProfiler(object):
+
+    def __init__(self, directory, max_files, sample_percent, slow_threshold, output_format):
+        if output_format not in profile_formats:
+            raise ValueError('Unknown profile format \'' + str(output_format) + '\'')
+
+        self.directory = directory
+        self.max_files = max_files
+        self.sample_percent = sample_percent
+        self.slow_threshold = slow_threshold
+        self.output_format = output_format
+        makedirs(directory, exist_ok=True)
+        self.reset()
+
+    def reset(self):
+        # one profiled request at a time, also with profilers exclusive for the whole process
+        self.lock = Lock()
+
+    def is_sampled(self):
+        return self.sample_percent > 0 and random.random() * 100 < self.sample_percent
+
+    def start(self):
+        if not self.lock.acquire(blocking=False):
+            return None
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active
+            self.lock.release()
+            return None
+        return profile
+
+    def stop(self, profile):
+        profile.disable()
+        self.lock.release()
+
+    def save(self, profile, endpoint, seconds):
+        name = '%d-%d-%s-%.1fms' % (int(time() * 1000), getpid(), unsafe_chars.sub('_', endpoint), seconds * 1000)
+
+        if self.output_format == 'collapsed':
+            name += '.collapsed'
+            profile.create_stats()
+            with open(join(self.directory, name), 'w') as f:
+                f.write(collapse_stats(profile.stats))
+        else:
+            name += '.prof'
+            pstats.Stats(profile).dump_stats(join(self.directory, name))
+
+        self.prune()
+        return name
+
+    def prune(self):
+        # files of other workers may be removed concurrently
+        files = []
+        for name in listdir(self.directory):
+            if not profile_name.match(name):
+                continue
+            try:
+                files.append((getmtime(join(self.directory, name)), name))
+            except OSError:
+                pass
+
+        for mtime, name in sorted(files)[:max(0, len(files) - self.max_files)]:
+            try:
+                remove(join(self.directory, name))
+            except OSError:
+                pass
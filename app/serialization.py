@@ -0,0 +1,111 @@
+from flask.json.provider import DefaultJSONProvider
+import staff
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+compact_separators = (',', ':')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+
+    def dumps(self, obj, **kwargs):
+        # output is always compact, indent and separators of the default provider are ignored
+        return orjson.dumps(obj, default=self.default, option=orjson.OPT_SORT_KEYS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+def make_json_provider(app, encoder):
+    if encoder == 'auto':
+        encoder = 'json' if orjson is None else 'orjson'
+
+    if encoder == 'orjson':
+        if orjson is None:
+            raise RuntimeError('orjson is required for \'orjson\' JSON encoder')
+        provider = OrjsonProvider(app)
+    elif encoder == 'json':
+        provider = DefaultJSONProvider(app)
+    else:
+        raise ValueError('Unknown JSON encoder \'' + str(encoder) + '\'')
+
+    provider.compact = True
+    return provider
+
+
+def dumps_compact(provider, obj):
+    return provider.dumps(obj, separators=compact_separators)
+
+
+class EmployeeSerializer(object):
+
+    def __init__(self, employee_uri):
+        # URI of employee with id 0, all employee URIs differ only by id
+        self.uri_prefix = employee_uri[:-1]
+
+    def make_public_employee(self, employee):
+        new_employee = {}
+        for col in employee:
+            if col == 'id':
+                new_employee['uri'] = self.uri_prefix + str(employee['id'])
+            else:
+                new_employee[col] = employee[col]
+        return new_employee
+
+    def make_public_employees(self, employees):
+        uri_prefix = self.uri_prefix
+        # keys are in sorted order, so the result is the same for encoders sorting them or not
+        return [
+            {
+                'birthdate': e['birthdate'],
+                'enrollmentdate': e['enrollmentdate'],
+                'name': e['name'],
+                'position': e['position'],
+                'uri': uri_prefix + str(e['id'])
+            }
+            for e in employees
+        ]
+
+    def dumps_employees(self, provider, employees):
+        # employees of JSON array without brackets, to be joined in streamed lists
+        return dumps_compact(provider, self.make_public_employees(employees))[1:-1]
+
+
+class EmployeesPageWriter(object):
+
+    def __init__(self, serializer, provider, limit):
+        self.serializer = serializer
+        self.provider = provider
+        self.limit = limit
+        self.count = 0
+        self.last_id = None
+        self.is_truncated = False
+
+    def start(self):
+        return '{"employees":['
+
+    def write(self, employees):
+        if self.limit is not None and self.count + len(employees) > self.limit:
+            employees = employees[:self.limit - self.count]
+            self.is_truncated = True
+
+        if len(employees) == 0:
+            return ''
+
+        chunk = self.serializer.dumps_employees(self.provider, employees)
+        if self.count > 0:
+            chunk = ',' + chunk
+
+        self.count += len(employees)
+        self.last_id = employees[-1]['id']
+        return chunk
+
+    def finish(self):
+        if self.limit is None:
+            return ']}'
+
+        next_cursor = staff.encode_cursor(self.last_id) if self.is_truncated else None
+        return '],"next":' + dumps_compact(self.provider, next_cursor) + '}'
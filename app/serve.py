@@ -0,0 +1,46 @@
+from multiprocessing import cpu_count
+from gunicorn.app.base import BaseApplication
+from app import create_app
+import argparse
+
+
+class Server(BaseApplication):
+
+    def __init__(self, options, config=None):
+        self.options = options
+        self.config = config
+        BaseApplication.__init__(self)
+
+    def load_config(self):
+        for key in self.options:
+            self.cfg.set(key, self.options[key])
+
+    def load(self):
+        # with preload the application is created once in the master, workers reset it after fork
+        return create_app(self.config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Production server of the employee API (gunicorn)')
+    parser.add_argument('--bind', default='127.0.0.1:5000')
+    parser.add_argument('--workers', type=int, default=cpu_count())
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--preload', action='store_true')
+    parser.add_argument('--timeout', type=int, default=30)
+    args = parser.parse_args()
+
+    Server(
+        {
+            'bind': args.bind,
+            'workers': args.workers,
+            'threads': args.threads,
+            'worker_class': 'gthread' if args.threads > 1 else 'sync',
+            'preload_app': args.preload,
+            'timeout': args.timeout
+        },
+        config={'DEBUG': False}
+    ).run()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,45 @@
 from datetime import datetime, date
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from binascii import Error as DecodeError
+from functools import lru_cache
 from flask import abort
+from math import isfinite
+import operator
 import random
+import re
 
 class Routes(object):
     api_path = '/api/v1/'
     api_employees = api_path + "employees"
     api_employee = api_path + 'employees/<int:employee_id>'
     api_employees_filter = api_path + 'employees/filter'
+    api_employees_bulk = api_path + 'employees/bulk'
+    api_employees_search = api_path + 'employees/search'
+    api_metrics = api_path + 'metrics'
+    api_admin_sql_profile = api_path + 'admin/sql-profile'
 
 filter_columns = {
     'age': 'birthdate',
     'experience': 'enrollmentdate',
     'position': 'position'
 }
+filter_iso_columns = {
+    'age': 'birthdate_iso',
+    'experience': 'enrollmentdate_iso'
+}
 filter_pointers = ['key', 'expr', 'value']
 math_expressions = ['<', '<=', '=', '!=', '>=', '>']
 string_expressions = ['=', '!=']
 comparison_symbols = ['=', '>', '!', '<']
 str_comparison_symbols = ['=', '!']
+comparison_operators = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '=': operator.eq,
+    '!=': operator.ne,
+    '>=': operator.ge,
+    '>': operator.gt
+}
 min_filters_number = 1
 max_filters_number = 5
 chars_decimals = range(32, 127)
@@ -26,6 +48,15 @@ min_int_filter_value = 0
 max_int_filter_value = 65
 min_str_length = 1
 max_str_length = 120
+max_bulk_employees = 10000
+max_page_size = 1000
+default_search_page_size = 20
+max_search_terms = 10
+# words as split by unicode61 tokenizer of full-text index, '*' after a word makes it a prefix
+search_term = re.compile(r'([^\W_]+)(\*?)')
+# ASCII digits only, ids and limits fit in 64-bit integers of SQLite
+page_number = re.compile(r'[0-9]{1,18}')
+stress_positions_number = 99
 
 def convert_str_to_date(s):
     return datetime.strptime(s, "%d.%m.%Y")
@@ -33,14 +64,28 @@ def convert_str_to_date(s):
 def convert_date_to_str(d):
     return d.strftime("%d.%m.%Y")
 
+def convert_str_to_iso(s):
+    d = convert_str_to_date(s)
+    return '%04d-%02d-%02d' % (d.year, d.month, d.day)
+
 def is_date(s):
     try:
         convert_str_to_date(s)
         return True
-    except ValueError:
+    except (ValueError, TypeError):
         return False
 
 
+def is_correct_employee(employee, employee_keys):
+    return type(employee) == dict and \
+        len([x for x in employee if x in employee_keys]) == len(employee_keys) and \
+        len([k for k in employee_keys if type(employee[k]) != str]) == 0 and \
+        is_date(employee['birthdate']) and \
+        is_date(employee['enrollmentdate']) and \
+        len(employee['name']) <= max_str_length and \
+        len(employee['position']) <= max_str_length
+
+
 def check_filtration(filters_list):
     if len(filters_list) > max_filters_number or \
             len(filters_list) < min_filters_number:
@@ -60,12 +105,125 @@ def check_filtration(filters_list):
     return filters_list
 
 
+def encode_cursor(employee_id):
+    return urlsafe_b64encode(('id:' + str(employee_id)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        value = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (DecodeError, UnicodeError, ValueError):
+        abort(400)
+
+    if not value.startswith('id:') or not page_number.fullmatch(value[3:]):
+        abort(400)
+
+    return int(value[3:])
+
+
+def check_pagination(args):
+    limit = args.get('limit')
+    after = args.get('after')
+
+    if limit is None:
+        if after is not None:
+            abort(400)
+        return None, None
+
+    if not page_number.fullmatch(limit) or \
+            int(limit) < 1 or \
+            int(limit) > max_page_size:
+        abort(400)
+
+    if after is None:
+        return int(limit), None
+
+    return int(limit), decode_cursor(after)
+
+
+def make_search_query(text):
+    # terms are quoted, so FTS5 operators and syntax errors of user text are never parsed
+    if text is None or len(text) > max_str_length:
+        abort(400)
+
+    terms = ['"' + word + '"' + star for word, star in search_term.findall(text)]
+    if len(terms) == 0 or len(terms) > max_search_terms:
+        abort(400)
+
+    return ' '.join(terms)
+
+
+def encode_search_cursor(rank, employee_id):
+    # repr of float is exact, so the next page starts right after the last row
+    return urlsafe_b64encode(('rank:' + repr(rank) + ':id:' + str(employee_id)).encode()).decode().rstrip('=')
+
+
+def decode_search_cursor(cursor):
+    try:
+        value = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+    except (DecodeError, UnicodeError, ValueError):
+        abort(400)
+
+    parts = value.split(':')
+    if len(parts) != 4 or parts[0] != 'rank' or parts[2] != 'id' or not page_number.fullmatch(parts[3]):
+        abort(400)
+
+    try:
+        rank = float(parts[1])
+    except ValueError:
+        abort(400)
+
+    if not isfinite(rank):
+        abort(400)
+
+    return rank, int(parts[3])
+
+
+def check_search_pagination(args):
+    limit = args.get('limit', str(default_search_page_size))
+    after = args.get('after')
+
+    if not page_number.fullmatch(limit) or \
+            int(limit) < 1 or \
+            int(limit) > max_page_size:
+        abort(400)
+
+    if after is None:
+        return int(limit), None
+
+    return int(limit), decode_search_cursor(after)
+
+
+def is_stream_requested(args):
+    stream = args.get('stream', 'false')
+    if stream not in ['true', 'false']:
+        abort(400)
+    return stream == 'true'
+
+
+def canonicalize_filters(filters_list):
+    canonical_filters = set()
+    for filt in filters_list:
+        if filt['key'] == 'position':
+            canonical_filters.add((filt['key'], filt['expr'], filt['value']))
+        else:
+            canonical_filters.add((filt['key'], filt['expr'], int(filt['value'])))
+    return tuple(sorted(canonical_filters, key=lambda f: (f[0], f[1], str(f[2]))))
+
+
 def calculate_years(from_date_str):
     from_date = convert_str_to_date(from_date_str)
     today = date.today()
     return today.year - from_date.year - ((today.month, today.day) < (from_date.month, from_date.day))
 
 
+def calculate_years_boundary(years):
+    # calculate_years(d) >= years  <=>  convert_str_to_iso(d) <= boundary
+    today = date.today()
+    years = min(years, today.year)
+    return '%04d-%02d-%02d' % (today.year - years, today.month, today.day)
+
+
 def is_correct_comparison(existed_value, expr, comparison_value, is_date=True):
     if is_date:
         existed_value = calculate_years(existed_value)
@@ -85,6 +243,52 @@ def is_correct_comparison(existed_value, expr, comparison_value, is_date=True):
         return existed_value > comparison_value
 
 
+@lru_cache(maxsize=65536)
+def convert_str_to_date_key(s):
+    day, month, year = s.split('.')
+    return int(year), int(month), int(day)
+
+
+def compile_filter(filt, today):
+    compare = comparison_operators[filt['expr']]
+    column = filter_columns[filt['key']]
+
+    if filt['key'] == 'position':
+        value = filt['value']
+        return lambda employee: compare(employee[column], value)
+
+    # calculate_years(d) >= years  <=>  date key of d <= boundary
+    years = int(filt['value'])
+    boundary = (today.year - years, today.month, today.day)
+    next_boundary = (today.year - years - 1, today.month, today.day)
+
+    if filt['expr'] == '>=':
+        return lambda employee: convert_str_to_date_key(employee[column]) <= boundary
+    elif filt['expr'] == '>':
+        return lambda employee: convert_str_to_date_key(employee[column]) <= next_boundary
+    elif filt['expr'] == '<':
+        return lambda employee: convert_str_to_date_key(employee[column]) > boundary
+    elif filt['expr'] == '<=':
+        return lambda employee: convert_str_to_date_key(employee[column]) > next_boundary
+    elif filt['expr'] == '=':
+        return lambda employee: next_boundary < convert_str_to_date_key(employee[column]) <= boundary
+    else:
+        return lambda employee: not next_boundary < convert_str_to_date_key(employee[column]) <= boundary
+
+
+def compile_filters(filters_list):
+    today = date.today()
+    checks = [compile_filter(filt, today) for filt in filters_list]
+
+    def predicate(employee):
+        for check in checks:
+            if not check(employee):
+                return False
+        return True
+
+    return predicate
+
+
 class FilterGenerator(object):
     def generate_filter(self, key, employees=None):
         if key != 'position':
@@ -136,6 +340,21 @@ class EmployeeGenerator(object):
         year = str(random.randint(1960, 2000))
         return '.'.join([day, month, year])
 
+    def generate_valid_date(self, start_year, stop_year):
+        day = random.randint(
+            date(start_year, 1, 1).toordinal(),
+            date(stop_year, 12, 31).toordinal()
+        )
+        return convert_date_to_str(date.fromordinal(day))
+
+    def generate_employee(self):
+        return {
+            'name': self.generate_str(),
+            'birthdate': self.generate_valid_date(1960, 2001),
+            'position': 'user_pos_' + str(random.randint(1, stress_positions_number)).zfill(2),
+            'enrollmentdate': self.generate_valid_date(2000, 2018)
+        }
+
     def is_char_available(self, c):
         if c in self.get_available_chars():
             return True
@@ -0,0 +1,379 @@
+from argparse import ArgumentParser
+from collections import Counter
+from json import dumps
+from math import ceil
+from os import makedirs
+from time import perf_counter, time
+from urllib.parse import urlsplit
+import asyncio
+import csv
+import io
+from app import staff
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+report_percentiles = [50, 75, 90, 95, 99, 99.9, 100]
+max_error_samples = 10
+# users are started one by one over it (seconds), as ramp-up time of the former JMeter plans
+default_ramp_up = 1
+
+
+class LatencyHistogram(object):
+    # log-linear buckets of microseconds (as HdrHistogram), relative error below 1 / sub_bucket_half
+
+    def __init__(self, sub_bucket_bits=8):
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.sub_bucket_half = self.sub_bucket_count >> 1
+        self.counts = Counter()
+        self.total = 0
+        self.sum = 0
+        self.min = None
+        self.max = 0
+
+    def get_index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+
+        shift = value.bit_length() - self.sub_bucket_count.bit_length() + 1
+        return self.sub_bucket_count + (shift - 1) * self.sub_bucket_half + (value >> shift) - self.sub_bucket_half
+
+    def get_highest_value(self, index):
+        if index < self.sub_bucket_count:
+            return index
+
+        shift = (index - self.sub_bucket_count) // self.sub_bucket_half + 1
+        mantissa = (index - self.sub_bucket_count) % self.sub_bucket_half + self.sub_bucket_half
+        return ((mantissa + 1) << shift) - 1
+
+    def record(self, seconds):
+        value = int(seconds * 1000000)
+        self.counts[self.get_index(value)] += 1
+        self.total += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def get_value_at_percentile(self, percent):
+        if self.total == 0:
+            return 0
+
+        target = max(1, int(ceil(percent / 100.0 * self.total)))
+        count = 0
+        for index in sorted(self.counts):
+            count += self.counts[index]
+            if count >= target:
+                return min(self.get_highest_value(index), self.max)
+        return self.max
+
+    def get_distribution(self):
+        # (latency, cumulative percentile, cumulative count) per filled bucket
+        distribution = []
+        count = 0
+        for index in sorted(self.counts):
+            count += self.counts[index]
+            distribution.append(
+                (min(self.get_highest_value(index), self.max), 100.0 * count / self.total, count)
+            )
+        return distribution
+
+    def to_dict(self):
+        result = {
+            'count': self.total,
+            'min_ms': round((self.min or 0) / 1000.0, 3),
+            'mean_ms': round(self.sum / 1000.0 / self.total, 3) if self.total else 0.0,
+            'max_ms': round(self.max / 1000.0, 3)
+        }
+        for percent in report_percentiles:
+            result['p' + format(percent, 'g') + '_ms'] = round(self.get_value_at_percentile(percent) / 1000.0, 3)
+        return result
+
+
+class HttpConnection(object):
+    # minimal HTTP/1.1 keep-alive client, reconnects after responses closing the connection
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method, path, body=None):
+        return await asyncio.wait_for(self.exchange(method, path, body), self.timeout)
+
+    async def exchange(self, method, path, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        payload = b'' if body is None else dumps(body).encode('utf-8')
+        head = method + ' ' + path + ' HTTP/1.1\r\n' + \
+            'Host: ' + self.host + ':' + str(self.port) + '\r\n' + \
+            'Connection: keep-alive\r\n' + \
+            'Content-Length: ' + str(len(payload)) + '\r\n'
+        if body is not None:
+            head += 'Content-Type: application/json\r\n'
+        self.writer.write(head.encode('latin-1') + b'\r\n' + payload)
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError('Connection closed by server')
+        version, status = status_line.decode('latin-1').split()[:2]
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, value = line.decode('latin-1').split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+
+        is_close = headers.get('connection') == 'close' or \
+            (version == 'HTTP/1.0' and headers.get('connection') != 'keep-alive')
+
+        if method == 'HEAD' or status in ('204', '304'):
+            data = b''
+        elif headers.get('transfer-encoding') == 'chunked':
+            data = await self.read_chunked()
+        elif 'content-length' in headers:
+            data = await self.reader.readexactly(int(headers['content-length']))
+        else:
+            data = await self.reader.read()
+            is_close = True
+
+        if is_close:
+            await self.close()
+        return int(status), data
+
+    async def read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # trailers up to the empty line
+                while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self.reader.readexactly(size))
+            await self.reader.readline()
+
+    async def close(self):
+        writer = self.writer
+        self.reader = self.writer = None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+
+class Scenario(object):
+
+    def __init__(self, method, path, expected_status, make_body=None, setup_employees=0):
+        self.method = method
+        self.path = path
+        self.expected_status = expected_status
+        self.make_body = make_body
+        self.setup_employees = setup_employees
+
+
+class Generator(staff.FilterGenerator, staff.EmployeeGenerator):
+
+    def make_employee(self, employees):
+        return self.generate_employee()
+
+    def make_filters(self, employees):
+        # several position filters are a conflict (409), only the first one is kept
+        filters_list = []
+        for f in self.generate_filters_list(employees):
+            if f['key'] != 'position' or not [p for p in filters_list if p['key'] == 'position']:
+                filters_list.append(f)
+        return filters_list
+
+
+generator = Generator()
+
+# scenarios of former JMeter plans, setup employees are inserted by one user before the load
+scenarios = {
+    'test_stress_insert': Scenario('POST', staff.Routes.api_employees, 201, generator.make_employee),
+    'test_stress_get_all': Scenario('GET', staff.Routes.api_employees, 200, setup_employees=1000),
+    'test_stress_get_filtered': Scenario(
+        'POST', staff.Routes.api_employees_filter, 200, generator.make_filters, setup_employees=1000
+    ),
+    'test_stress_delete_all': Scenario('DELETE', staff.Routes.api_employees, 200)
+}
+
+
+class LoadReport(object):
+
+    def __init__(self, name, threads, loops):
+        self.name = name
+        self.threads = threads
+        self.loops = loops
+        self.histogram = LatencyHistogram()
+        self.statuses = Counter()
+        self.errors = 0
+        self.error_samples = []
+        self.started = None
+        self.seconds = 0.0
+
+    def record(self, status, seconds, is_expected):
+        self.histogram.record(seconds)
+        self.statuses[str(status)] += 1
+        if not is_expected:
+            self.add_error('Unexpected status ' + str(status))
+
+    def record_failure(self, err, seconds):
+        self.histogram.record(seconds)
+        self.statuses[type(err).__name__] += 1
+        self.add_error(type(err).__name__ + ': ' + str(err))
+
+    def add_error(self, message):
+        self.errors += 1
+        if len(self.error_samples) < max_error_samples:
+            self.error_samples.append(message)
+
+    def get_error_rate(self):
+        return self.errors / float(self.histogram.total) if self.histogram.total else 0.0
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'started': self.started,
+            'threads': self.threads,
+            'loops': self.loops,
+            'requests': self.histogram.total,
+            'errors': self.errors,
+            'error_rate': round(self.get_error_rate(), 6),
+            'seconds': round(self.seconds, 3),
+            'throughput': round(self.histogram.total / self.seconds, 2) if self.seconds > 0 else 0.0,
+            'statuses': dict(self.statuses),
+            'latency': self.histogram.to_dict(),
+            'error_samples': self.error_samples
+        }
+
+    def to_csv(self):
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(['latency_ms', 'percentile', 'total_count'])
+        for value, percent, count in self.histogram.get_distribution():
+            writer.writerow([round(value / 1000.0, 3), round(percent, 4), count])
+        return output.getvalue()
+
+    def save(self, directory):
+        makedirs(directory, exist_ok=True)
+        path = directory + '/' + self.name
+        with open(path + '.json', 'w') as f:
+            f.write(dumps(self.to_dict(), indent=4))
+        with open(path + '.csv', 'w') as f:
+            f.write(self.to_csv())
+        return path + '.json', path + '.csv'
+
+
+def raise_open_files_limit(connections):
+    # every virtual user keeps its own connection
+    if resource is None:
+        return
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = connections + 256
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        if hard != resource.RLIM_INFINITY:
+            wanted = min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+async def run_setup(host, port, scenario, timeout):
+    employees = []
+    connection = HttpConnection(host, port, timeout)
+    try:
+        for i in range(scenario.setup_employees):
+            employee = generator.generate_employee()
+            status, data = await connection.request('POST', staff.Routes.api_employees, employee)
+            # duplicate of an earlier random employee is harmless
+            if status == 201:
+                employees.append(employee)
+            elif status != 409:
+                raise AssertionError('Setup employee not inserted, status ' + str(status))
+    finally:
+        await connection.close()
+    return employees
+
+
+async def run_user(host, port, scenario, loops, timeout, employees, report, in_flight, delay):
+    await asyncio.sleep(delay)
+    connection = HttpConnection(host, port, timeout)
+    try:
+        for i in range(loops):
+            body = scenario.make_body(employees) if scenario.make_body else None
+            # connection is opened by the first request, so connecting users are also limited
+            async with in_flight:
+                started = perf_counter()
+                try:
+                    status, data = await connection.request(scenario.method, scenario.path, body)
+                except (OSError, EOFError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as err:
+                    report.record_failure(err, perf_counter() - started)
+                    await connection.close()
+                    continue
+                report.record(status, perf_counter() - started, status == scenario.expected_status)
+    finally:
+        await connection.close()
+
+
+async def run_scenario(server, name, threads, loops, timeout=None, ramp_up=default_ramp_up, max_in_flight=None):
+    address = urlsplit(server)
+    host = address.hostname or 'localhost'
+    port = address.port or 80
+    scenario = scenarios[name]
+
+    employees = await run_setup(host, port, scenario, timeout)
+
+    report = LoadReport(name, threads, loops)
+    report.started = time()
+    started = perf_counter()
+    # every user has a request in flight unless the limit is given
+    in_flight = asyncio.Semaphore(min(threads, max_in_flight) if max_in_flight else threads)
+    await asyncio.gather(*[
+        run_user(host, port, scenario, loops, timeout, employees, report, in_flight, ramp_up * i / float(threads))
+        for i in range(threads)
+    ])
+    report.seconds = perf_counter() - started
+    return report
+
+
+def run_load(server, name, threads, loops, timeout=None, ramp_up=default_ramp_up, max_in_flight=None):
+    raise_open_files_limit(threads)
+    return asyncio.run(run_scenario(server, name, threads, loops, timeout, ramp_up, max_in_flight))
+
+
+def main():
+    parser = ArgumentParser(description='Load test of the employee API')
+    parser.add_argument('scenario', choices=sorted(scenarios))
+    parser.add_argument('--server', default='http://localhost:5000')
+    parser.add_argument('--threads', type=int, default=100)
+    parser.add_argument('--loops', type=int, default=10)
+    parser.add_argument('--timeout', type=float, help='seconds to wait for a response, no limit by default')
+    parser.add_argument('--ramp-up', type=float, default=default_ramp_up, help='seconds to start all users')
+    parser.add_argument('--max-in-flight', type=int, help='limit of requests sent at the same time, one per user by default')
+    parser.add_argument('--output', help='directory of JSON and CSV reports')
+    args = parser.parse_args()
+
+    report = run_load(args.server, args.scenario, args.threads, args.loops, args.timeout, args.ramp_up, args.max_in_flight)
+    if args.output:
+        report.save(args.output)
+    print(dumps(report.to_dict(), indent=4))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,16 @@
-from os.path import abspath, dirname, exists
-from shutil import rmtree
+from os.path import abspath, dirname
 from json import loads, dumps
 from time import sleep
+from datetime import date, datetime
+from threading import Thread, Event
 import subprocess
+import sys
 import requests
 import pytest
 import allure
 import random
 from app import staff
+from app.tests import load
 
 from requests.exceptions import ConnectionError, ReadTimeout
 
@@ -22,6 +25,10 @@ class BaseTestClass(
     standard_loop_count = 10 #times
     start_unavailable_str_length = 121
     stop_unavailable_str_length = 4096
+    load_report_dir = '/tmp/load'
+    max_error_rate = 0.0
+    load_ramp_up = load.default_ramp_up
+    load_max_in_flight = None
 
     def get_server(self):
         if hasattr(self, 'server'):
@@ -86,6 +93,25 @@ class BaseTestClass(
             )
         return inserted_employees
 
+    @allure.step('Bulk insertion of employees')
+    def insert_employees_bulk(self, employees):
+        response = requests.post(
+            self.get_server() + self.api_employees_bulk,
+            json=employees,
+            timeout=self.standard_timeout
+        )
+
+        assert response.status_code == 200, \
+            "Employees not inserted!"
+
+        assert 'employees' in response.json(), \
+            "No information about inserted employees in response!"
+
+        assert len(response.json()['employees']) == len(employees), \
+            "Number of results not equal to number of employees in request!"
+
+        return response.json()['employees']
+
     @allure.step("Deletion of all employees")
     def delete_employees(self):
         try:
@@ -116,6 +142,94 @@ class BaseTestClass(
 
         return response.json()['employees']
 
+    @allure.step("Getting page of employees (limit {1})")
+    def get_employees_page(self, limit, after=None):
+        params = {'limit': limit}
+        if after is not None:
+            params['after'] = after
+
+        response = requests.get(
+            self.get_server() + self.api_employees,
+            params=params,
+            timeout=self.standard_timeout
+        )
+
+        assert response.status_code == 200, \
+            "Page of employees not received!"
+
+        assert 'employees' in response.json() and 'next' in response.json(), \
+            "No information about employees page in response!"
+
+        assert len(response.json()['employees']) <= limit, \
+            "Page of employees is bigger than limit!"
+
+        return response.json()['employees'], response.json()['next']
+
+    @allure.step("Getting all employees as stream")
+    def get_employees_streamed(self):
+        response = requests.get(
+            self.get_server() + self.api_employees,
+            params={'stream': 'true'},
+            stream=True,
+            timeout=self.standard_timeout
+        )
+
+        assert response.status_code == 200, \
+            "Employees stream not received!"
+
+        employees = loads(response.content)
+
+        assert 'employees' in employees, \
+            "No information about employees in stream!"
+
+        return employees['employees']
+
+    @allure.step("Conditional getting of {url} (modified: {is_modified})")
+    def get_conditionally(self, url, etag, is_modified):
+        response = requests.get(
+            url,
+            headers={'If-None-Match': etag},
+            timeout=self.standard_timeout
+        )
+
+        assert 'ETag' in response.headers, \
+            "No ETag in response!"
+
+        if is_modified:
+            assert response.status_code == 200, \
+                "Modified resource not received!"
+
+            assert response.headers['ETag'] != etag, \
+                "ETag of modified resource not changed!"
+        else:
+            assert response.status_code == 304, \
+                "Not modified resource received again!"
+
+            assert len(response.content) == 0, \
+                "Not empty body of response for not modified resource!"
+
+        return response.headers['ETag']
+
+    @allure.step("Getting metrics")
+    def get_metrics(self):
+        response = requests.get(
+            self.get_server() + self.api_metrics,
+            timeout=self.standard_timeout
+        )
+
+        assert response.status_code == 200, \
+            "Metrics not received!"
+
+        assert response.headers['Content-Type'].startswith('text/plain'), \
+            "Metrics not in text exposition format!"
+
+        samples = {}
+        for line in response.text.splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
     @allure.step("Get employee by URI")
     def get_employee_by_uri(self, uri, is_exists=True):
         response = requests.get(
@@ -309,6 +423,54 @@ class BaseTestClass(
 
             return response.json()['employees']
 
+    @allure.step("Search of employees by \'{1}\'")
+    def search_employees_in_db(self, search_text, filters_list=None, limit=None, after=None, is_broken=False):
+        params = {'q': search_text}
+        if limit is not None:
+            params['limit'] = limit
+        if after is not None:
+            params['after'] = after
+
+        if filters_list is None:
+            response = requests.get(
+                self.get_server() + self.api_employees_search,
+                params=params,
+                timeout=self.standard_timeout
+            )
+        else:
+            response = requests.post(
+                self.get_server() + self.api_employees_search,
+                params=params,
+                json=filters_list,
+                timeout=self.standard_timeout
+            )
+
+        if is_broken:
+            assert response.status_code == 400, \
+                "Request with broken search not aborted!"
+            return [], None
+
+        assert response.status_code == 200, \
+            "Employees not searched!"
+
+        assert 'employees' in response.json() and 'next' in response.json(), \
+            "No information about searched employees in response!"
+
+        return response.json()['employees'], response.json()['next']
+
+    @allure.step("Search of employees in list by words {2}")
+    def get_searched_employees_from_list(self, employees, words):
+        # word ending with '*' is a prefix of a word of name or position
+        searched_employees = []
+        for employee in employees:
+            employee_words = staff.search_term.findall((employee['name'] + ' ' + employee['position']).lower())
+            if len([
+                w for w in words
+                if not [e for e, star in employee_words if e == w.lower() or (w.endswith('*') and e.startswith(w[:-1].lower()))]
+            ]) == 0:
+                searched_employees.append(employee)
+        return searched_employees
+
     @allure.step("Deletion of filtered employees from database")
     def delete_filtered_employees_from_db(self, filters_list, is_empty=False, position_conflict=False, is_broken=False):
         response = requests.delete(
@@ -351,28 +513,10 @@ class BaseTestClass(
         excluded_employees = []
 
         if len([f for f in filters_list if f['key'] == 'position']) <= 1:
+            is_filtered = staff.compile_filters(filters_list)
 
             for employee in employees:
-                filtration_results = []
-                for filt in filters_list:
-
-                    if filt['key'] == 'position':
-                        is_date = False
-                    else:
-                        is_date = True
-
-                    if staff.is_correct_comparison(
-                            employee[staff.filter_columns[filt['key']]],
-                            filt['expr'],
-                            filt['value'],
-                            is_date=is_date
-                    ):
-                        filtration_results.append(True)
-                    else:
-                        filtration_results.append(False)
-                        break
-
-                if filtration_results.count(False) == 0:
+                if is_filtered(employee):
                     filtered_employees.append(employee)
                 else:
                     excluded_employees.append(employee)
@@ -391,67 +535,33 @@ class BaseTestClass(
 
     @allure.step("Stress test \'{1}\'")
     def stress_test(self, test_name, threads=100, loops=10):
-        test_file = abspath(dirname(__file__)) + "/" + test_name + ".jmx"
-        assert exists(test_file), \
-            "Test file not exists!"
 
         @allure.step("Test execution ({1} threads, {2} loops)")
         def test_execution(test_name, threads, loops):
-            stress_test = subprocess.Popen(
-                [
-                    self.jmeter_path,
-                    "-Jjmeter.save.saveservice.output_format=csv",
-                    "-n",
-                    "-t",
-                    test_file,
-                    "-Jserver_host=" + self.get_server_host(),
-                    "-Jserver_port=" + self.get_server_port(),
-                    "-Jthreads=" + str(threads),
-                    "-Jloops=" + str(loops),
-                    "-l",
-                    self.jmeter_jtl_dir + "/" + test_name + ".csv",
-                    "-j",
-                    self.jmeter_jtl_dir + "/" + test_name + ".log"
-                ],
-                shell=False
+            return load.run_load(
+                self.get_server(), test_name, threads, loops,
+                ramp_up=self.load_ramp_up, max_in_flight=self.load_max_in_flight
             )
-            stress_test.wait()
-
-            return stress_test.returncode
 
         @allure.step("Test report generation")
-        def generate_report(test_name):
-            if exists(self.jmeter_jtl_dir + "/" + test_name):
-                rmtree(self.jmeter_jtl_dir + "/" + test_name)
-
-            report_generation = subprocess.Popen(
-                [
-                    self.jmeter_path,
-                    "-g",
-                    self.jmeter_jtl_dir + "/" + test_name + ".csv",
-                    "-o",
-                    self.jmeter_jtl_dir + "/" + test_name + "/"
-                ],
-                shell=False
+        def generate_report(report):
+            json_path, csv_path = report.save(self.load_report_dir)
+
+            attach_dict_to_report(report.to_dict(), test_name + ' summary')
+            allure.attach.file(
+                csv_path,
+                name=test_name + ' latency distribution',
+                attachment_type=allure.attachment_type.CSV
             )
-            report_generation.wait()
 
-            allure.dynamic.link(
-                self.report_server + "/" + test_name + '/index.html',
-                name='JMeter Dashboard'
-            )
-
-            return report_generation.returncode
+        report = test_execution(test_name, threads, loops)
+        generate_report(report)
 
-        result_code = test_execution(test_name, threads, loops)
-        if result_code == 0:
-            report_code = generate_report(test_name)
+        assert report.histogram.total == threads * loops, \
+            "Not all requests of test executed!"
 
-        assert result_code == 0, \
-            "Test incorrectly completed!"
-
-        assert report_code == 0, \
-            "Report not successfully generated!"
+        assert report.get_error_rate() <= self.max_error_rate, \
+            "Error rate " + str(report.get_error_rate()) + " exceeds " + str(self.max_error_rate) + "!"
 
 
 # ------------------------------------------------------ #
@@ -462,7 +572,7 @@ def test_fixture(request):
     for p in test_params.keys():
         setattr(request.cls, p, test_params[p])
 
-    app_file = "app.py"
+    app_file = getattr(request.cls, 'app_file', "app.py")
     app_path = abspath(dirname(abspath(dirname(__file__)))) + "/" + app_file
 
     request.cls.app = subprocess.Popen(
@@ -480,6 +590,27 @@ def test_fixture(request):
     request.addfinalizer(test_finish)
 
 
+@pytest.fixture(params=['python', 'numpy'])
+def queries_fixture(request, tmp_path):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+
+    # data layer is run in process, its modules import each other from app directory
+    app_dir = dirname(dirname(abspath(__file__)))
+    if app_dir not in sys.path:
+        sys.path.insert(0, app_dir)
+    from flask import Flask
+    from db.queries import Queries
+
+    app = Flask('tests')
+    app.config.update(DATABASE=str(tmp_path / 'tests.db'), FILTER_ENGINE=request.param, FILTER_CACHE_SIZE=0)
+    queries = Queries(app)
+    app.teardown_appcontext(lambda error: queries.close_db())
+
+    yield app, queries
+    queries.close_connections()
+
+
 # ------------------------DEFAULTS---------------------- #
 default_employees = [
     {
@@ -542,6 +673,24 @@ class Test_functional_positive(BaseTestClass):
         )
         self.insert_default_employees()
 
+    def test_insert_employees_bulk(self):
+        allure.dynamic.description(
+            'Bulk insertion of default employees with duplicate and broken items, checking per-item statuses'
+        )
+        self.delete_employees()
+        results = self.insert_employees_bulk(
+            default_employees + [default_employees[0], {'name': self.generate_str()}]
+        )
+
+        assert [r['status'] for r in results] == ['created'] * len(default_employees) + ['duplicate', 'invalid'], \
+            "Incorrect statuses of bulk inserted employees!"
+
+        self.check_employees_lists_match(
+            self.get_employees(),
+            default_employees,
+            self.is_employees_list_equal_without_uri
+        )
+
     def test_delete_employees(self):
         allure.dynamic.description('Base deletion of employees with checking response')
         self.delete_employees()
@@ -559,6 +708,82 @@ class Test_functional_positive(BaseTestClass):
             self.is_employees_lists_equal_by_uri
         )
 
+    def test_get_employees_paginated(self):
+        allure.dynamic.description(
+            'Insertion of default employees and receiving them page by page with comparison to full list'
+        )
+        self.insert_default_employees(is_empty_db=True)
+
+        received_employees = []
+        employees, after = self.get_employees_page(2)
+        received_employees += employees
+        while after is not None:
+            employees, after = self.get_employees_page(2, after)
+            received_employees += employees
+
+        self.check_employees_lists_match(
+            self.get_employees(),
+            received_employees,
+            self.is_employees_lists_equal
+        )
+
+    def test_get_employees_streamed(self):
+        allure.dynamic.description(
+            'Insertion of default employees and comparison of streamed and ordinary employees lists'
+        )
+        self.insert_default_employees(is_empty_db=True)
+
+        self.check_employees_lists_match(
+            self.get_employees(),
+            self.get_employees_streamed(),
+            self.is_employees_lists_equal
+        )
+
+    def test_get_employees_not_modified(self):
+        allure.dynamic.description(
+            'Insertion of default employees, conditional receiving of employees list and employee before and \
+             after insertion of another employee'
+        )
+        inserted_employees = self.insert_default_employees(is_empty_db=True)
+        employees_url = self.get_server() + self.api_employees
+
+        employees_etag = requests.get(employees_url, timeout=self.standard_timeout).headers['ETag']
+        employee_etag = requests.get(inserted_employees[0]['uri'], timeout=self.standard_timeout).headers['ETag']
+
+        self.get_conditionally(employees_url, employees_etag, is_modified=False)
+        self.get_conditionally(inserted_employees[0]['uri'], employee_etag, is_modified=False)
+
+        self.insert_employee(
+            {
+                'name': self.generate_str(),
+                'birthdate': '01.01.1990',
+                'position': 'QA',
+                'enrollmentdate': '01.01.2015'
+            }
+        )
+
+        self.get_conditionally(employees_url, employees_etag, is_modified=True)
+        self.get_conditionally(inserted_employees[0]['uri'], employee_etag, is_modified=False)
+
+    def test_get_metrics(self):
+        allure.dynamic.description(
+            'Insertion of default employees, receiving of employees list and comparison of request and rows metrics \
+             before and after it'
+        )
+        inserted_employees = self.insert_default_employees(is_empty_db=True)
+        requests_sample = 'rest_app_requests_total{route="api.get_employees",method="GET",status="200"}'
+        rows_sample = 'rest_app_rows_returned_total{route="api.get_employees",method="GET"}'
+
+        metrics_before = self.get_metrics()
+        self.get_employees()
+        metrics_after = self.get_metrics()
+
+        assert metrics_after[requests_sample] == metrics_before.get(requests_sample, 0) + 1, \
+            "Request not counted in metrics!"
+
+        assert metrics_after[rows_sample] == metrics_before.get(rows_sample, 0) + len(inserted_employees), \
+            "Returned employees not counted in metrics!"
+
     def test_get_employees_oneByOne(self):
         allure.dynamic.description(
             'Insertion and receiving \'one by one\' of default employees with comparison of both lists, based on responses data'
@@ -771,6 +996,78 @@ class Test_functional_positive(BaseTestClass):
                 self.is_employees_list_equal_without_uri
             )
 
+    def test_get_filtered_employees_after_writes(self):
+        allure.dynamic.description(
+            'Insertion default employees, repeated filtration by position around deletion and insertion of \
+             employee, checking that filtered employees follow database changes'
+        )
+        self.insert_default_employees(is_empty_db=True)
+        filt = self.generate_filter('position', default_employees)
+
+        filtered_db_employees = self.get_filtered_employees_from_db([filt])
+        self.delete_employee_by_uri(filtered_db_employees[0]['uri'])
+
+        self.check_employees_lists_match(
+            filtered_db_employees[1:],
+            self.get_filtered_employees_from_db([filt]),
+            self.is_employees_lists_equal
+        )
+
+        employee = dict(filtered_db_employees[0])
+        employee.pop('uri')
+        self.insert_employee(employee)
+
+        self.check_employees_lists_match(
+            self.get_filtered_employees_from_list(default_employees, [filt])[0],
+            self.get_filtered_employees_from_db([filt]),
+            self.is_employees_list_equal_without_uri
+        )
+
+    def test_search_employees(self):
+        allure.dynamic.description(
+            'Insertion default employees and checking their search by words and prefixes of name and position'
+        )
+        self.insert_default_employees(is_empty_db=True)
+
+        for words in [['python'], ['Senior', 'engineer'], ['maks*'], ['ivan*', 'dev*']]:
+            self.check_employees_lists_match(
+                self.get_searched_employees_from_list(default_employees, words),
+                self.search_employees_in_db(' '.join(words))[0],
+                self.is_employees_list_equal_without_uri
+            )
+
+    def test_search_filtered_employees(self):
+        allure.dynamic.description(
+            'Insertion default employees and checking search combined with filtration by age and experience'
+        )
+        self.insert_default_employees(is_empty_db=True)
+        filters_list = [self.generate_filter('age'), self.generate_filter('experience')]
+
+        self.check_employees_lists_match(
+            self.get_filtered_employees_from_list(
+                self.get_searched_employees_from_list(default_employees, ['dev*']),
+                filters_list
+            )[0],
+            self.search_employees_in_db('dev*', filters_list)[0],
+            self.is_employees_list_equal_without_uri
+        )
+
+    def test_search_employees_paginated(self):
+        allure.dynamic.description(
+            'Insertion default employees and receiving search results page by page with comparison to full results'
+        )
+        self.insert_default_employees(is_empty_db=True)
+
+        received_employees = []
+        employees, after = self.search_employees_in_db('e*', limit=1)
+        received_employees += employees
+        while after is not None:
+            employees, after = self.search_employees_in_db('e*', limit=1, after=after)
+            received_employees += employees
+
+        assert received_employees == self.search_employees_in_db('e*')[0], \
+            "Pages of search results differ from full results!"
+
     def test_delete_age_filtered_employees(self):
         allure.dynamic.description(
             'Insertion default employees, deletion with age filter, checking that only necessary items deleted and \
@@ -1050,6 +1347,77 @@ class Test_functional_negative(BaseTestClass):
                 is_broken=not self.is_char_available(char)
             )
 
+    def test_get_sql_profile_unauthorized(self):
+        allure.dynamic.description(
+            'Receiving of SQL profile without and with wrong admin credentials'
+        )
+        for auth in [None, ('admin', self.generate_str())]:
+            response = requests.get(
+                self.get_server() + self.api_admin_sql_profile,
+                auth=auth,
+                timeout=self.standard_timeout
+            )
+
+            # 404 when profiler is not enabled in application config
+            assert response.status_code in [401, 404], \
+                "SQL profile available without admin credentials!"
+
+    def test_search_with_broken_query(self):
+        allure.dynamic.description(
+            'Insertion default employees and checking that search not passed with empty query, \
+             query of symbols only and broken cursor'
+        )
+        self.insert_default_employees(is_empty_db=True)
+
+        for search_text in ['', '*** -- ""', 'x' * self.start_unavailable_str_length]:
+            self.search_employees_in_db(search_text, is_broken=True)
+
+        self.search_employees_in_db('python', limit=1, after=self.generate_str(), is_broken=True)
+
+    def test_get_with_broken_pagination(self):
+        allure.dynamic.description(
+            'Insertion default employees and checking that pages of employees and search not passed with \
+             limits and cursors of non-ASCII digits and with ids too big for database'
+        )
+        self.insert_default_employees(is_empty_db=True)
+
+        for params in [
+            {'limit': '\u00b2'},
+            {'limit': '1', 'after': staff.encode_cursor('\u00b2')},
+            {'limit': '1', 'after': staff.encode_cursor('9' * 30)}
+        ]:
+            response = requests.get(
+                self.get_server() + self.api_employees,
+                params=params,
+                timeout=self.standard_timeout
+            )
+
+            assert response.status_code == 400, \
+                "Request with broken pagination not aborted!"
+
+        self.search_employees_in_db('python', limit='\u00b2', is_broken=True)
+        self.search_employees_in_db('python', limit=1, after=staff.encode_search_cursor(0.0, '9' * 30), is_broken=True)
+
+    def test_insert_bulk_with_broken_encoding(self):
+        allure.dynamic.description(
+            'Bulk insertion of NDJSON lines with invalid UTF-8 and checking that broken line is reported \
+             as invalid and the other one is inserted'
+        )
+        self.delete_employees()
+
+        response = requests.post(
+            self.get_server() + self.api_employees_bulk,
+            data=b'\xff\xfe\n' + dumps(default_employees[0]).encode('utf-8'),
+            headers={'Content-Type': 'application/x-ndjson'},
+            timeout=self.standard_timeout
+        )
+
+        assert response.status_code == 200, \
+            "Bulk insertion with broken encoding not handled!"
+
+        assert [e['status'] for e in response.json()['employees']] == ['invalid', 'created'], \
+            "Broken line not reported as invalid!"
+
     def test_insert_error_birthdate(self):
         allure.dynamic.description(
             'Insertion of employee with special symbols at birthdate and checking responses'
@@ -1754,6 +2122,124 @@ class Test_stress_deletion(BaseTestClass):
         )
 
 
+@allure.story('Data layer tests')
+class Test_data_layer(object):
+    def test_insert_reported_after_delete_all(self, queries_fixture):
+        allure.dynamic.description(
+            'Insertion of employee committed before deletion of all employees, but reported to filter engine \
+             after it, checking that the employee is not filtered afterwards'
+        )
+        app, queries = queries_fixture
+        filters_list = [{'key': 'age', 'expr': '>=', 'value': '0'}]
+
+        with app.app_context():
+            queries.insert_employee(default_employees[0])
+            assert len(queries.select_with_filtration(filters_list)) == 1, \
+                "Inserted employee not filtered!"
+
+        # insertion is held after its commit, until all employees are deleted
+        committed = Event()
+        released = Event()
+        record_revision = queries.record_revision
+
+        def hold_revision(revision):
+            committed.set()
+            released.wait(5)
+            record_revision(revision)
+
+        def insert():
+            with app.app_context():
+                queries.insert_employee(default_employees[1])
+
+        queries.record_revision = hold_revision
+        inserting = Thread(target=insert)
+        inserting.start()
+        assert committed.wait(5), \
+            "Insertion not committed!"
+        queries.record_revision = record_revision
+
+        with app.app_context():
+            queries.delete_all()
+        released.set()
+        inserting.join(5)
+
+        with app.app_context():
+            assert queries.select_all() == [], \
+                "Employees left after deletion of all!"
+            assert queries.select_with_filtration(filters_list) == [], \
+                "Deleted employee filtered!"
+
+    def test_filtration_cached_across_midnight(self, queries_fixture, monkeypatch):
+        allure.dynamic.description(
+            'Filtration started before local midnight and finished after it, checking that its result \
+             with ages and experiences of the previous day is not served from cache'
+        )
+        app, queries = queries_fixture
+        filters_list = [{'key': 'age', 'expr': '>=', 'value': '0'}]
+        import cache
+
+        today = [date(2024, 1, 1)]
+        midnight = datetime(2024, 1, 2).timestamp()
+        clock = [midnight - 1]
+
+        class FakeDate(date):
+            @classmethod
+            def today(cls):
+                return today[0]
+
+        monkeypatch.setattr(cache, 'date', FakeDate)
+        monkeypatch.setattr(cache, 'time', lambda: clock[0])
+        queries.filter_cache = cache.ResultCache(16, 60)
+
+        select_filtered_rows = queries.select_filtered_rows
+
+        def select_until_midnight(filters_list, limit, after_id):
+            employees = select_filtered_rows(filters_list, limit, after_id)
+            today[0] = date(2024, 1, 2)
+            clock[0] = midnight + 1
+            return employees
+
+        queries.select_filtered_rows = select_until_midnight
+
+        with app.app_context():
+            queries.insert_employee(default_employees[0])
+            queries.select_with_filtration(filters_list)
+            queries.select_with_filtration(filters_list)
+
+        assert queries.filter_cache.stats()['hits'] == 0, \
+            "Filtration of the previous day served from cache!"
+
+    def test_search_index_follows_deletes(self, queries_fixture):
+        allure.dynamic.description(
+            'Deletion of employees by id, by filters and of all employees, checking that full-text index \
+             keeps exactly the employees left'
+        )
+        app, queries = queries_fixture
+
+        def get_indexed_count():
+            return queries.execute_query('select count(*) as count from employees_fts_docsize', commit=False)[0]['count']
+
+        with app.app_context():
+            ids = queries.insert_employees(default_employees)
+            queries.delete_employee_by_id(ids[1])
+            assert [e['id'] for e in queries.search_employees('python')] == [ids[2]], \
+                "Employee deleted by id found!"
+
+            queries.delete_employees([{'key': 'position', 'expr': '=', 'value': 'QC engineer'}])
+            assert [e['id'] for e in queries.search_employees('engineer')] == [ids[0]], \
+                "Employee deleted by filters found!"
+            assert get_indexed_count() == len(queries.select_all()), \
+                "Deleted employees left in full-text index!"
+
+            queries.delete_all()
+            assert get_indexed_count() == 0, \
+                "Employees left in full-text index after deletion of all!"
+
+            queries.insert_employee(default_employees[1])
+            assert len(queries.search_employees('python')) == 1, \
+                "Employee inserted after deletion of all not found!"
+
+
 # ------------------------------------------------------ #
 
 if __name__ == "__main__":
@@ -1763,15 +2249,7 @@ if __name__ == "__main__":
         'reruns_number': '0',
         'reruns_delay': '0',
         'allure_dir': '/tmp/allure',
-        'jmeter_jtl_dir': '/tmp/jmeter',
-        'jmeter_path': abspath(dirname(
-            abspath(dirname(
-                abspath(dirname(
-                    __file__
-                ))
-            ))
-        )) + "/apache-jmeter/bin/jmeter",
-        'report_server': 'http://localhost:8000'
+        'load_report_dir': '/tmp/load'
     }
 
     test_path = abspath(__file__)